@@ -7,8 +7,10 @@
 
 #pylint: disable=line-too-long
 
+import os
 import unittest
 
+from xpra.net import digest as digest_module
 from xpra.net.digest import (
     get_digests, get_digest_module,
     choose_digest, gendigest, verify_digest,
@@ -43,6 +45,33 @@ class TestDigest(unittest.TestCase):
             assert choose_digest((h,))==h
             assert choose_digest((h, "hmac+sha512"))=="hmac+sha512"
 
+    def test_xor(self):
+        def x(s1, s2):
+            return b"".join(b"%c" % (a ^ b) for a,b in zip(s1,s2))
+        saved = digest_module.XOR_STR_MIN_SIZE
+        try:
+            #exercise both the native (if available) and the pure python code paths:
+            for min_size in (1, 64, 2**31):
+                digest_module.XOR_STR_MIN_SIZE = min_size
+                xor = digest_module.xor
+                for s1, s2 in (
+                    (b"", b""),
+                    (b"\0", b"\0"),
+                    (b"\0\1\2", b"\xff\xfe\xfd"),
+                    (b"hello", b"world"),
+                    (b"short", b"longer than s1"),
+                    (os.urandom(64), os.urandom(64)),
+                    (os.urandom(128), os.urandom(100)),
+                    ):
+                    assert xor(s1, s2)==x(s1, s2), "xor(%r, %r)=%r, expected %r" % (s1, s2, xor(s1, s2), x(s1, s2))
+                    #other buffer types must give the same result:
+                    for t in (bytearray, memoryview):
+                        assert xor(t(s1), t(s2))==x(s1, s2), "xor failed with %s" % t
+        finally:
+            digest_module.XOR_STR_MIN_SIZE = saved
+        #gendigest pads the salt to the length of the password:
+        assert gendigest("xor", b"\1\2\3", b"\1")==b"\0\2\3"
+
 
 def main():
     unittest.main()
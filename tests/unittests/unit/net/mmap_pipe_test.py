@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2022 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import mmap
+import array
+import unittest
+
+from xpra.net.mmap_pipe import mmap_write, mmap_read, write_mmap_token, read_mmap_token
+
+MMAP_SIZE = 100
+
+
+class MMAPPipeTest(unittest.TestCase):
+
+    def test_write_read(self):
+        area = mmap.mmap(-1, MMAP_SIZE)
+        data = bytes(range(60))
+        chunks, free_size = mmap_write(area, MMAP_SIZE, memoryview(data))
+        assert chunks==[(8, 60)]
+        assert free_size==MMAP_SIZE-8-60
+        assert bytes(mmap_read(area, *chunks))==data
+        #wraps around the end of the mmap area:
+        data = bytes(range(100, 140))
+        chunks, _ = mmap_write(area, MMAP_SIZE, bytearray(data))
+        assert chunks==[(68, 32), (8, 8)]
+        assert mmap_read(area, *chunks)==data
+
+    def test_write_wide_buffer(self):
+        area = mmap.mmap(-1, MMAP_SIZE)
+        #the buffer length is in bytes, not items:
+        pixels = array.array("I", (0x11223344, 0x55667788))
+        chunks, _ = mmap_write(area, MMAP_SIZE, memoryview(pixels))
+        assert chunks==[(8, 8)]
+        assert bytes(mmap_read(area, *chunks))==pixels.tobytes()
+
+    def test_token(self):
+        area = mmap.mmap(-1, MMAP_SIZE)
+        write_mmap_token(area, 0x0102030405, 10, 16)
+        #least significant byte first:
+        assert area[10:26]==bytes((5, 4, 3, 2, 1))+bytes(11)
+        assert read_mmap_token(area, 10, 16)==0x0102030405
+        assert read_mmap_token(area, 11, 16)==0x01020304
+        with self.assertRaises(AssertionError):
+            write_mmap_token(area, 1<<16, 0, 2)
+
+    def test_too_big(self):
+        area = mmap.mmap(-1, MMAP_SIZE)
+        chunks, _ = mmap_write(area, MMAP_SIZE, b"0"*MMAP_SIZE)
+        assert chunks is None
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
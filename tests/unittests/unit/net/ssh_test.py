@@ -6,9 +6,11 @@
 
 import unittest
 
+from unit.test_util import silence_warn
 from xpra.util import AdHocStruct
+from xpra.net import ssh
 from xpra.net.ssh import (
-    keymd5, get_default_keyfiles,
+    keymd5, get_default_keyfiles, get_open_channel_timeout,
     )
 
 
@@ -22,6 +24,14 @@ class SSHTest(unittest.TestCase):
     def test_default_keyfiles(self):
         assert get_default_keyfiles()
 
+    def test_open_channel_timeout(self):
+        default = ssh.OPEN_CHANNEL_TIMEOUT
+        assert get_open_channel_timeout()==default
+        assert get_open_channel_timeout({"open-channel-timeout" : "30"})==30
+        with silence_warn(ssh):
+            for invalid in ("notanumber", "0", -5):
+                assert get_open_channel_timeout({"open-channel-timeout" : invalid})==default
+
 
 def main():
     unittest.main()
@@ -14,6 +14,7 @@ import uuid
 import hmac
 from time import monotonic
 
+from unit.test_util import silence_warn
 from xpra.os_util import (
     strtobytes, bytestostr,
     WIN32, OSX, POSIX,
@@ -118,6 +119,56 @@ class TestAuth(unittest.TestCase):
         for module in test_modules:
             self._test_module(module)
 
+    def test_nss_cache(self):
+        from xpra.server.auth import sys_auth_base
+        calls = []
+        def lookup(name):
+            calls.append(name)
+            if name=="missing":
+                raise KeyError(name)
+            return "entry-for-%s" % name
+        nss_lookup = sys_auth_base.nss_lookup
+        try:
+            assert nss_lookup(lookup, "foo")=="entry-for-foo"
+            #cached:
+            assert nss_lookup(lookup, "foo")=="entry-for-foo"
+            assert calls==["foo"]
+            assert nss_lookup(lookup, "bar")=="entry-for-bar"
+            assert calls==["foo", "bar"]
+            #failed lookups are not cached:
+            for _ in range(2):
+                with self.assertRaises(KeyError):
+                    nss_lookup(lookup, "missing")
+            assert calls==["foo", "bar", "missing", "missing"]
+            #expired entries are looked up again:
+            key = (lookup, "foo")
+            value, _ = sys_auth_base.nss_cache[key]
+            sys_auth_base.nss_cache[key] = (value, monotonic()-sys_auth_base.NSS_CACHE_TTL-1)
+            assert nss_lookup(lookup, "foo")=="entry-for-foo"
+            assert calls==["foo", "bar", "missing", "missing", "foo"]
+        finally:
+            for name in ("foo", "bar"):
+                sys_auth_base.nss_cache.pop((lookup, name), None)
+
+    def test_salt_cache(self):
+        from xpra.server.auth.sys_auth_base import SaltCache
+        c = SaltCache(3)
+        for salt in (b"a", b"b", b"c"):
+            c.append(salt)
+            assert salt in c
+        c.append(b"a")
+        assert len(c)==3
+        c.append(b"d")
+        assert len(c)==3
+        assert b"a" not in c
+        for salt in (b"b", b"c", b"d"):
+            assert salt in c
+        #hex encoded salts are stored as bytes:
+        c.append("0a0b")
+        assert "0a0b" in c
+        assert b"\x0a\x0b" in c
+        assert b"b" not in c
+
     def test_fail(self):
         try:
             fa = self._init_auth("fail")
@@ -384,6 +435,150 @@ class TestAuth(unittest.TestCase):
         exec_cmd("/bin/true", True)
         exec_cmd("/bin/false", False)
 
+    def test_ldap3_pool(self):
+        try:
+            mod = self.a("ldap3")
+            from ldap3.core.exceptions import LDAPSessionTerminatedByServerError
+        except ImportError as e:
+            print("Warning: ldap3 auth test skipped")
+            print(f" {e}")
+            return
+        from xpra.util import AdHocStruct
+        connections = []
+        class FakeConnection:
+            def __init__(self, server, **_kwargs):
+                self.server = server
+                self.closed = False
+                self.dead = False
+                self.user = self.password = None
+                self.binds = []
+                self.extend = AdHocStruct()
+                self.extend.standard = AdHocStruct()
+                self.extend.standard.who_am_i = lambda : self.user
+                connections.append(self)
+            def open(self):
+                pass
+            def rebind(self, user=None, password=None, authentication=None, **_kwargs):
+                if self.dead:
+                    #the server closed the socket, but `closed` is not set:
+                    raise LDAPSessionTerminatedByServerError("session terminated by server")
+                if user:
+                    self.user = user
+                self.binds.append((self.user, authentication))
+                return not (password or "").startswith("bad")
+            def unbind(self):
+                self.closed = True
+        def user_binds():
+            return sum(1 for c in connections for b in c.binds if b[0]=="foo")
+        saved = mod.Connection
+        saved_cache_size = mod.LDAP_NEG_CACHE_SIZE
+        mod.Connection = FakeConnection
+        mod.FAILED_BINDS.clear()
+        a = self._init_auth("ldap3", host="pool-test-host", username="foo")
+        try:
+            dead = FakeConnection(a.server)
+            dead.dead = True
+            mod.CONNECTION_POOL[a.pool_key] = [dead]
+            #the dead connection is discarded and the login is retried:
+            assert a.check("secret") is True
+            assert dead.closed
+            assert len(connections)==2
+            conn = connections[1]
+            #the connection was returned to the pool without the user's session:
+            assert mod.CONNECTION_POOL[a.pool_key]==[conn]
+            assert conn.user is None and conn.password is None
+            assert conn.binds==[("foo", a.auth_mechanism), (None, mod.ANONYMOUS)]
+            #and it is re-used for the next login:
+            assert a.check("secret") is True
+            assert len(connections)==2
+            #a rejected password is cached,
+            #so it is rejected again without another bind:
+            binds = user_binds()
+            assert a.check("bad") is False
+            assert user_binds()==binds+1
+            assert a.check("bad") is False
+            assert user_binds()==binds+1
+            #but the correct password still works straight away:
+            assert a.check("secret") is True
+            assert user_binds()==binds+2
+            #and clears the previous failures:
+            assert not mod.FAILED_BINDS
+            assert a.check("bad") is False
+            assert user_binds()==binds+3
+            #expired entries are discarded:
+            key = a.get_failed_bind_key("bad")
+            assert key in mod.FAILED_BINDS
+            mod.FAILED_BINDS[key] = (monotonic()-mod.LDAP_NEG_CACHE_TTL-1, "foo")
+            assert a.check("bad") is False
+            assert user_binds()==binds+4
+            #only the most recent failures are kept:
+            mod.FAILED_BINDS.clear()
+            mod.LDAP_NEG_CACHE_SIZE = 2
+            for password in ("bad1", "bad2", "bad3"):
+                assert a.check(password) is False
+            assert len(mod.FAILED_BINDS)==2
+            assert a.get_failed_bind_key("bad1") not in mod.FAILED_BINDS
+            assert a.check("bad1") is False
+            assert user_binds()==binds+8
+            assert a.check("bad3") is False
+            assert user_binds()==binds+8
+            #connection errors on new connections are not retried:
+            mod.CONNECTION_POOL[a.pool_key] = []
+            def dead_connection(server, **kwargs):
+                c = FakeConnection(server, **kwargs)
+                c.dead = True
+                return c
+            mod.Connection = dead_connection
+            assert a.check("secret") is False
+            assert len(connections)==3
+            #and they are not cached as rejections:
+            assert a.get_failed_bind_key("secret") not in mod.FAILED_BINDS
+        finally:
+            mod.Connection = saved
+            mod.LDAP_NEG_CACHE_SIZE = saved_cache_size
+            mod.CONNECTION_POOL.pop(a.pool_key, None)
+            mod.FAILED_BINDS.clear()
+
+    def test_ldap3_concurrency(self):
+        try:
+            mod = self.a("ldap3")
+            import ldap3
+            assert ldap3
+        except ImportError as e:
+            print("Warning: ldap3 auth test skipped")
+            print(f" {e}")
+            return
+        a = self._init_auth("ldap3", host="concurrency-test-host", username="foo", concurrency=2)
+        b = self._init_auth("ldap3", host="concurrency-test-host", username="bar")
+        saved_timeout = mod.LDAP_CONCURRENCY_TIMEOUT
+        try:
+            #authenticators for the same server share the same limit:
+            sem = a.bind_semaphore
+            assert b.bind_semaphore is sem
+            checks = []
+            def do_check(password):
+                checks.append(password)
+                if password=="error":
+                    raise Exception("test error")
+                return True, False
+            a.do_check = do_check
+            assert a.check("secret") is True
+            #the semaphore is released, even when the check fails:
+            with self.assertRaises(Exception):
+                a.check("error")
+            for _ in range(2):
+                assert sem.acquire(blocking=False)
+            #no more slots available, so we don't even try to bind:
+            mod.LDAP_CONCURRENCY_TIMEOUT = 0
+            with silence_warn(mod):
+                assert a.check("secret") is False
+            assert checks==["secret", "error"]
+            for _ in range(2):
+                sem.release()
+        finally:
+            mod.LDAP_CONCURRENCY_TIMEOUT = saved_timeout
+            mod.BIND_SEMAPHORES.pop(a.pool_key, None)
+
     def test_keycloak(self):
         try:
             self._init_auth("keycloak")
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2022 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import tempfile
+import unittest
+
+from xpra.util import AdHocStruct
+from xpra.server.control_command import ControlError
+from xpra.server.mixins import server_base_controlcommands
+
+
+class Server(server_base_controlcommands.ServerBaseControlCommands):
+    """
+    Just enough server state to run the control commands
+    """
+    def __init__(self):
+        super().__init__()
+        self.control_commands = {}
+        self._server_sources = {}
+        self._id_to_window = {}
+
+
+class ControlCommandsTest(unittest.TestCase):
+
+    def test_parse_4intlist(self):
+        parse_4intlist = server_base_controlcommands.parse_4intlist
+        assert parse_4intlist("")==[]
+        assert parse_4intlist("(0,10,100,20)")==[[0, 10, 100, 20]]
+        assert parse_4intlist(" (0,10,100,20), (200, 300, 20, 20) ")==[[0, 10, 100, 20], [200, 300, 20, 20]]
+        for invalid in ("(1,2,3)", "x(1,2,3,4)", "(1,2,3,4),(a,b,c,d)", "1,2,3,4"):
+            with self.assertRaises(ValueError):
+                parse_4intlist(invalid)
+
+    def test_parse_boolean_value(self):
+        parse_boolean_value = server_base_controlcommands.parse_boolean_value
+        for v in ("1", "true", "ON", "yes", True):
+            assert parse_boolean_value(v) is True
+        for v in ("0", "false", "Off", "no", False):
+            assert parse_boolean_value(v) is False
+        with self.assertRaises(ControlError):
+            parse_boolean_value("maybe")
+
+    def test_add_control_commands(self):
+        s1 = Server()
+        s1.add_control_commands()
+        s2 = Server()
+        s2.add_control_commands()
+        names = [spec[0] for spec in server_base_controlcommands.CONTROL_COMMANDS]
+        names += server_base_controlcommands.ENCODING_PROPERTIES
+        assert sorted(s1.control_commands.keys())==sorted(names)
+        #each instance must have its own bound methods:
+        for name in names:
+            assert s1.control_commands[name].do_run.__self__ is s1
+            assert s2.control_commands[name].do_run.__self__ is s2
+            #the command objects are slotted:
+            assert not hasattr(s1.control_commands[name], "__dict__")
+
+    def test_toggle_feature(self):
+        changed = []
+        class TestServer(Server):
+            dbus_proxy = False
+            def setting_changed(self, setting, value):
+                changed.append((setting, value))
+        s = TestServer()
+        s.control_command_toggle_feature("dbus-proxy")
+        assert s.dbus_proxy is True
+        s.control_command_toggle_feature("dbus-proxy", False)
+        assert s.dbus_proxy is False
+        assert changed==[("dbus-proxy", True), ("dbus-proxy", False)]
+        #invalid or missing features are left alone:
+        s.control_command_toggle_feature("invalid")
+        s.control_command_toggle_feature("bell", True)
+        assert not hasattr(s, "bell")
+        assert len(changed)==2
+
+    def test_ws_from_args(self):
+        s = Server()
+        s._id_to_window = {1 : "window1", 2 : "window2", 3 : "window3"}
+        source1 = AdHocStruct()
+        source1.window_sources = {1 : "ws1-1", 2 : "ws1-2", 4 : "ws1-4"}
+        source2 = AdHocStruct()
+        source2.window_sources = {3 : "ws2-3"}
+        s._server_sources = {"proto1" : source1, "proto2" : source2}
+        assert sorted(s._ws_from_args())==["ws1-1", "ws1-2", "ws2-3"]
+        assert sorted(s._ws_from_args("*"))==["ws1-1", "ws1-2", "ws2-3"]
+        assert sorted(s._ws_from_args("2", "3", "4"))==["ws1-2", "ws2-3"]
+        assert s._ws_from_args("4")==[]
+        with self.assertRaises(ControlError):
+            s._ws_from_args("foo")
+
+    def test_control_get_sources(self):
+        s = Server()
+        sources = []
+        for uuid, ui_client in (("a", True), ("b", False), ("c", True)):
+            ss = AdHocStruct()
+            ss.uuid = uuid
+            ss.ui_client = ui_client
+            sources.append(ss)
+        s._server_sources = dict(enumerate(sources))
+        def uuids(spec):
+            return [ss.uuid for ss in s._control_get_sources(spec)]
+        assert uuids("*")==["a", "b", "c"]
+        assert uuids("UI")==["a", "c"]
+        assert uuids("c,a")==["c", "a"]
+        assert uuids("b,b,missing")==["b"]
+        assert uuids("missing")==[]
+
+    def test_request_update(self):
+        s = Server()
+        s._id_to_window = {1 : "window1"}
+        damage = []
+        ws = AdHocStruct()
+        ws.window_dimensions = (640, 480)
+        ws.process_damage_region = lambda _now, *args : damage.append(args[:5])
+        source = AdHocStruct()
+        source.window_sources = {1 : ws}
+        s._server_sources = {"proto" : source}
+        s.control_command_request_update("png", "all", "1")
+        s.control_command_request_update("jpeg", "10,20,30,40", "1")
+        assert damage==[(0, 0, 640, 480, "png"), (10, 20, 30, 40, "jpeg")]
+        for invalid in ("1,2,3", "1,2,3,4,", "a,b,c,d"):
+            with self.assertRaises(ControlError):
+                s.control_command_request_update("png", invalid, "1")
+
+    def test_set_encoding_property(self):
+        s = Server()
+        s._id_to_window = {1 : "window1", 2 : "window2"}
+        values = {}
+        def ws(wid):
+            w = AdHocStruct()
+            w.set_min_quality = lambda v : values.__setitem__(wid, v)
+            return w
+        sources = []
+        for window_sources in ({1 : ws(1)}, {2 : ws(2)}):
+            source = AdHocStruct()
+            source.window_sources = window_sources
+            source.default_encoding_options = {}
+            sources.append(source)
+        s._server_sources = dict(enumerate(sources))
+        s.control_command_min_quality(50, "2")
+        assert values=={2 : 50}
+        s.control_command_min_quality(60)
+        assert values=={1 : 60, 2 : 60}
+        for source in sources:
+            assert source.default_encoding_options=={"min-quality" : 60}
+
+    def test_print_options(self):
+        calls = []
+        class TestServer(Server):
+            def do_control_file_command(self, *args):
+                calls.append(args)
+        s = TestServer()
+        s.control_command_print("file.pdf", "", "*", 0, "", "copies=2", "sides=two-sided=long", "=invalid", "noequal")
+        options = calls[0][-1][-1]
+        assert options=={"copies" : "2", "sides" : "two-sided=long"}, "unexpected options: %s" % (options,)
+
+    def test_send_file(self):
+        s = Server()
+        s.file_transfer = AdHocStruct()
+        s.file_transfer.file_size_limit = 1024
+        sent = []
+        ss = AdHocStruct()
+        ss.file_transfer = True
+        ss.file_size_limit = 1024
+        ss.send_file = lambda *args : sent.append(args)
+        s._server_sources = {"proto" : ss}
+        with tempfile.NamedTemporaryFile(prefix="xpra-send-file-test") as f:
+            f.write(b"hello")
+            f.flush()
+            s.control_command_send_file(f.name, "open", "*")
+            #the data is a snapshot of the file:
+            f.truncate(0)
+            f.flush()
+            assert sent[0][2:4]==(b"hello", 5)
+            f.write(b"0"*2048)
+            f.flush()
+            with self.assertRaises(ControlError):
+                s.control_command_send_file(f.name, "open", "*")
+        with self.assertRaises(ControlError):
+            s.control_command_send_file(os.path.join(tempfile.gettempdir(), "this-file-should-not-exist"))
+
+    def test_encoding_add_remove(self):
+        s = Server()
+        s._id_to_window = {1 : "window1"}
+        refreshed = []
+        ws = AdHocStruct()
+        ws.encodings = ("png", "jpeg")
+        ws.core_encodings = ("png", )
+        ws.do_set_client_properties = lambda _props : None
+        ws.refresh = lambda : refreshed.append(True)
+        source = AdHocStruct()
+        source.window_sources = {1 : ws}
+        s._server_sources = {"proto" : source}
+        s.control_command_encoding("add", "jpeg", "1")
+        assert ws.encodings==("png", "jpeg")
+        assert ws.core_encodings==("png", "jpeg")
+        assert len(refreshed)==1
+        s.control_command_encoding("remove", "png", "1")
+        assert ws.encodings==("jpeg", )
+        assert ws.core_encodings==("jpeg", )
+        assert len(refreshed)==2
+        #no-op: nothing to update or refresh
+        s.control_command_encoding("remove", "png", "1")
+        assert len(refreshed)==2
+
+    def test_window_filters(self):
+        s = Server()
+        s.window_filters = []
+        s.control_command_add_window_filter("window", "title", "=", "foo", "*")
+        s.control_command_add_window_filter("window", "title", "=", "bar", "a,b")
+        assert [uuid for uuid, _ in s.window_filters]==["*", "a", "b"]
+        assert s.control_command_remove_window_filters()=="removed 3 window-filters"
+        assert not s.window_filters
+
+    def test_compression(self):
+        from xpra.net.compression import init_compressors, get_enabled_compressors
+        init_compressors("zlib")
+        sent = []
+        class TestServer(Server):
+            def all_send_client_command(self, *args):
+                sent.append(args)
+        s = TestServer()
+        for c in get_enabled_compressors():
+            r = s.control_command_compression(c.upper())
+            assert r=="compressors set to %s" % c.upper(), "unexpected response: %r" % r
+            assert sent[-1]==("enable_%s" % c, )
+        with self.assertRaises(ControlError):
+            s.control_command_compression("invalid")
+
+    def test_move_resize(self):
+        s = Server()
+        window = AdHocStruct()
+        window.get_dimensions = lambda : (640, 480)
+        s._id_to_window = {1 : window}
+        calls = []
+        source1 = AdHocStruct()
+        source1.move_resize_window = lambda *args : calls.append(("move_resize_window", )+args[2:])
+        source1.resize_window = lambda *args : calls.append(("resize_window", )+args[2:])
+        #this connection does not support moving or resizing windows:
+        source2 = AdHocStruct()
+        s._server_sources = {"proto1" : source1, "proto2" : source2}
+        assert s.control_command_move(1, 10, 20)=="window 1 moved to 10,20 for 1 clients"
+        assert s.control_command_resize(1, 100, 200)=="window 1 resized to 100x200 for 1 clients"
+        s.control_command_moveresize(1, 1, 2, 3, 4)
+        assert calls==[
+            ("move_resize_window", 10, 20, 640, 480),
+            ("resize_window", 100, 200),
+            ("move_resize_window", 1, 2, 3, 4),
+            ]
+        with self.assertRaises(ControlError):
+            s.control_command_move(2, 0, 0)
+
+    def test_clipboard_direction(self):
+        changed = []
+        class TestServer(Server):
+            clipboard = True
+            def setting_changed(self, setting, value):
+                changed.append((setting, value))
+        s = TestServer()
+        directions = []
+        s._clipboard_helper = AdHocStruct()
+        s._clipboard_helper.set_direction = lambda *args : directions.append(args)
+        for direction in ("to-server", "TO-CLIENT", "both", "disabled"):
+            s.control_command_clipboard_direction(direction)
+        assert directions==[(True, False), (False, True), (True, True), (False, False)]
+        assert s.clipboard_direction=="disabled"
+        assert changed[-1]==("clipboard-direction", "disabled")
+        with self.assertRaises(ControlError):
+            s.control_command_clipboard_direction("sideways")
+
+    def test_video_region_enabled(self):
+        s = Server()
+        s._id_to_window = {1 : "window1"}
+        vs = AdHocStruct()
+        vs.set_enabled = lambda v : setattr(vs, "enabled", v)
+        vs.set_detection = lambda v : setattr(vs, "detection", v)
+        ws = AdHocStruct()
+        ws.video_subregion = vs
+        source = AdHocStruct()
+        source.window_sources = {1 : ws}
+        s._server_sources = {"proto" : source}
+        assert s.control_command_video_region_enabled(1, True)=="video region enabled for window 1"
+        assert vs.enabled is True
+        assert s.control_command_video_region_enabled(1, False)=="video region disabled for window 1"
+        assert vs.enabled is False
+        assert s.control_command_video_region_detection(1, True)=="video region detection enabled for window 1"
+        assert vs.detection is True
+        #the window must exist:
+        with self.assertRaises(ControlError):
+            s.control_command_reset_video_region(2)
+
+    def test_key(self):
+        keys = []
+        class TestServer(Server):
+            readonly = False
+            def fake_key(self, keycode, press):
+                keys.append((keycode, press))
+        s = TestServer()
+        s.control_command_key("38")
+        s.control_command_key("0x26", "unpress")
+        s.control_command_key("038", "1")
+        s.control_command_key("38", "0")
+        assert keys==[(38, True), (38, False), (38, True), (38, False)]
+        for args in (("foo", ), ("0", ), ("255", ), ("38", "invalid"), ("0o10", ), ("0b1", ), ("0X10", )):
+            with self.assertRaises(ControlError):
+                s.control_command_key(*args)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
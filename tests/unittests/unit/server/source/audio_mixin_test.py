@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2022 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.util import AdHocStruct
+from xpra.server.source import audio_mixin
+
+
+def make_audio_source(**kwargs):
+    m = audio_mixin.AudioMixin()
+    m.init_state()
+    m.sent = []
+    m.notifications = []
+    m.send = lambda *parts, **kw : m.sent.append((parts, kw))
+    m.may_notify = lambda *args, **kw : m.notifications.append(args)
+    for k, v in kwargs.items():
+        setattr(m, k, v)
+    return m
+
+
+class AudioMixinTest(unittest.TestCase):
+
+    def test_audio_loop_check(self):
+        machine_id, uuid = audio_mixin.get_local_ids()
+        #cached:
+        assert audio_mixin.get_local_ids()==(machine_id, uuid)
+        m = make_audio_source(machine_id=machine_id, uuid=uuid)
+        #no pulseaudio information:
+        assert m.audio_loop_check() is True
+        m.sound_properties = {"pulseaudio" : None}
+        assert m.audio_loop_check() is True
+        m.sound_properties = {"pulseaudio" : {"id" : "server-id"}}
+        m.pulseaudio_id = "client-id"
+        assert m.audio_loop_check() is True
+        assert not m.notifications
+        m.pulseaudio_id = "server-id"
+        assert m.audio_loop_check() is False
+        assert len(m.notifications)==1
+        #different machine:
+        m.machine_id = "not-%s" % machine_id
+        assert m.audio_loop_check() is True
+
+    def test_send_sound_data(self):
+        m = make_audio_source()
+        ss = AdHocStruct()
+        ss.codec = "opus"
+        ss.sequence = 2
+        metadata = {}
+        m.send_sound_data(ss, b"data", metadata)
+        m.send_sound_data(ss, b"data", {}, (b"meta", ), True)
+        parts, kw = m.sent[0]
+        assert parts[0]=="sound-data"
+        assert parts[1]=="opus"
+        assert parts[2].data==b"data"
+        assert parts[3] is metadata and metadata=={"sequence" : 2}
+        assert parts[4]==()
+        assert kw["fail_cb"] is None
+        parts, kw = m.sent[1]
+        assert parts[4].data==(b"meta", )
+        assert parts[4].can_inline
+        assert kw["fail_cb"]==m.sound_data_fail_cb
+
+    def test_new_sound_buffer(self):
+        m = make_audio_source()
+        m.is_closed = lambda : False
+        ss = AdHocStruct()
+        ss.codec = "opus"
+        ss.sequence = 0
+        ss.info = {}
+        m.sound_source = ss
+        #with and without debug logging,
+        #and without any packet metadata:
+        for debug in (False, True):
+            if debug:
+                audio_mixin.log.enable_debug()
+            else:
+                audio_mixin.log.disable_debug()
+            m.new_sound_buffer(ss, b"data", {})
+            m.new_sound_buffer(ss, b"data", {}, (b"meta", ))
+        audio_mixin.log.disable_debug()
+        assert len(m.sent)==4
+        for _ in range(10):
+            m.new_sound_buffer(ss, b"data", {})
+        #only the buffers after the first 10 can be dropped:
+        assert [kw["fail_cb"] is not None for _, kw in m.sent]==[False]*10+[True]*4
+        #buffers from other sources are dropped:
+        m.new_sound_buffer(AdHocStruct(), b"data", {})
+        assert len(m.sent)==14
+
+    def test_sound_control(self):
+        class Source(audio_mixin.AudioMixin):
+            def sound_control_av_sync_delta(self, delta):
+                return "delta=%s" % delta
+        m = Source()
+        m.init_state()
+        assert m.sound_control("new-sequence", "5")=="new sequence is 5"
+        assert m.sound_actions["new-sequence"].__self__ is m
+        assert m.sound_control(b"new_sequence", "6")=="new sequence is 6"
+        assert m.sound_source_sequence==6
+        assert m.sound_control("av-sync-delta", "10")=="delta=10"
+        assert m.sound_control("invalid")=="unknown sound action: invalid"
+        #the base class does not have the av-sync action:
+        assert "av-sync-delta" not in make_audio_source().sound_actions
+
+    def test_sound_fade(self):
+        timers = []
+        def timeout_add(delay, fn):
+            timers.append((delay, fn))
+            return len(timers)
+        m = make_audio_source(timeout_add=timeout_add, source_remove=lambda _timer : None)
+        volumes = []
+        ss = AdHocStruct()
+        ss.set_volume = volumes.append
+        m.sound_source = ss
+        stopped = []
+        m.start_sound_fade(1.0, 0.0, "500", lambda : stopped.append(True))
+        assert m.sound_fade_timer==1
+        delay, fade = timers[-1]
+        assert delay==100
+        while fade():
+            assert not stopped
+        assert [round(v, 2) for v in volumes]==[0.8, 0.6, 0.4, 0.2, 0.0]
+        assert stopped==[True]
+        assert m.sound_fade_timer is None
+        #the fade stops if the sound source goes away:
+        m.start_sound_fade(0.0, 1.0)
+        m.sound_source = None
+        assert timers[-1][1]() is False
+        assert len(volumes)==5
+
+    def test_new_stream_sound_playing(self):
+        m = make_audio_source()
+        proc = AdHocStruct()
+        proc.poll = lambda : None
+        m.new_stream_timers = {proc : 1}
+        #the previous sound is still playing, so no new timer is added:
+        m.play_new_stream_sound()
+        assert m.new_stream_timers=={proc : 1}
+
+    def test_bell_sample(self):
+        import os.path
+        sample = audio_mixin.get_bell_sample()
+        assert sample=="" or os.path.exists(sample)
+        assert audio_mixin.get_bell_sample() is sample
+
+    def test_stop_new_stream_notifications(self):
+        removed = []
+        m = make_audio_source(source_remove=removed.append)
+        terminated = []
+        procs = []
+        for exit_code in (None, 0):
+            proc = AdHocStruct()
+            proc.poll = lambda exit_code=exit_code : exit_code
+            proc.terminate = lambda proc=proc : terminated.append(proc)
+            procs.append(proc)
+        m.new_stream_timers = {procs[0] : 10, procs[1] : 11}
+        m.stop_new_stream_notifications()
+        assert sorted(removed)==[10, 11]
+        #only the process which is still running is terminated:
+        assert terminated==[procs[0]]
+        assert m.new_stream_timers=={}
+
+    def test_sound_data_loop(self):
+        checks = []
+        class Source(audio_mixin.AudioMixin):
+            def audio_loop_check(self, mode="speaker"):
+                checks.append(mode)
+                return False
+            def is_closed(self):
+                return False
+        m = Source()
+        m.init_state()
+        for _ in range(3):
+            m.sound_data("opus", b"data", {})
+        assert isinstance(m.sound_sink, audio_mixin.FakeSink)
+        assert m.sound_sink.codec=="opus"
+        #the loop check is only done once per codec:
+        assert checks==["microphone"]
+        m.sound_data("vorbis", b"data", {})
+        assert m.sound_sink.codec=="vorbis"
+        assert checks==["microphone", "microphone"]
+        m.sound_data("vorbis", b"", {"end-of-stream" : True})
+        assert m.sound_sink is None
+
+    def test_sound_source_latency(self):
+        m = make_audio_source()
+        assert m.get_sound_source_latency()==0
+        ss = AdHocStruct()
+        ss.codec = "opus"
+        ss.info = {b"latency" : "50", "queue" : {"cur" : 10}}
+        m.sound_source = ss
+        for debug in (False, True):
+            if debug:
+                audio_mixin.log.enable_debug()
+            else:
+                audio_mixin.log.disable_debug()
+            #the latency from the source info, plus the processing overhead:
+            assert m.get_sound_source_latency()==150
+        audio_mixin.log.disable_debug()
+        #no latency information yet, use the default value for this codec:
+        ss.info = {}
+        ss.default_latency = audio_mixin.get_default_latency("opus")
+        assert ss.default_latency>0
+        assert m.get_sound_source_latency()==ss.default_latency+100
+
+    def test_new_stream(self):
+        timers = {}
+        def timeout_add(delay, fn):
+            timers[len(timers)+1] = (delay, fn)
+            return len(timers)
+        removed = []
+        updates = []
+        m = make_audio_source(timeout_add=timeout_add, source_remove=removed.append)
+        m.update_av_sync_delay_total = lambda : updates.append(True)
+        ss = AdHocStruct()
+        ss.codec = ""
+        ss.sequence = 1
+        ss.cleanup = lambda : None
+        m.sound_source = ss
+        saved = audio_mixin.NEW_STREAM_SOUND
+        audio_mixin.NEW_STREAM_SOUND = False
+        try:
+            m.new_stream(ss, "opus")
+        finally:
+            audio_mixin.NEW_STREAM_SOUND = saved
+        parts, _ = m.sent[-1]
+        assert parts[:3]==("sound-data", "opus", "")
+        assert parts[3]["start-of-stream"] is True
+        assert ss.codec=="opus"
+        assert len(updates)==1
+        #the delayed update runs for the current source:
+        delay, fn = timers[m.sound_av_sync_timer]
+        assert delay==10*1000
+        assert fn() is False
+        assert len(updates)==2
+        assert m.sound_av_sync_timer is None
+        #but not for an old one:
+        m.new_stream(ss, "opus")
+        _, fn = timers[m.sound_av_sync_timer]
+        m.sound_source = None
+        fn()
+        assert len(updates)==3
+        #cancelled when the source is stopped:
+        m.sound_source = ss
+        m.new_stream(ss, "opus")
+        timer = m.sound_av_sync_timer
+        m.stop_sending_sound()
+        assert removed==[timer]
+        assert m.sound_av_sync_timer is None
+
+    def test_get_caps(self):
+        m = make_audio_source()
+        assert m.get_caps()=={}
+        m.sound_properties = {"pulseaudio" : {"id" : "pa-id"}, "plugins" : ("pulse", )}
+        m.supports_speaker = True
+        m.speaker_codecs = ("opus", )
+        caps = m.get_caps()
+        assert caps["sound.pulseaudio.id"]=="pa-id"
+        assert caps["sound.plugins"]==("pulse", )
+        assert caps["sound.encoders"]==("opus", )
+        assert caps["sound.send"] is True
+        assert caps["sound.receive"] is False
+        audio = caps["audio"]
+        assert audio["pulseaudio"]=={"id" : "pa-id"}
+        assert audio["encoders"]==("opus", )
+        #the server's properties are not modified:
+        assert "encoders" not in m.sound_properties
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2022 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import mmap
+import tempfile
+import unittest
+
+from xpra.util import typedict
+from xpra.net.mmap_pipe import read_mmap_token, write_mmap_token
+from xpra.server.source import mmap_connection
+
+MMAP_SIZE = 1024*1024
+
+
+class MMAPConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile(prefix="xpra-mmap-test")
+        self.file.write(b"\0"*MMAP_SIZE)
+        self.file.flush()
+
+    def tearDown(self):
+        self.file.close()
+
+    def make_connection(self, min_mmap_size=0):
+        c = mmap_connection.MMAP_Connection()
+        c.supports_mmap = True
+        c.mmap_filename = None
+        c.min_mmap_size = min_mmap_size
+        c.init_state()
+        return c
+
+    def write_client_token(self, token, index, count):
+        with open(self.file.name, "r+b") as f:
+            area = mmap.mmap(f.fileno(), MMAP_SIZE)
+            write_mmap_token(area, token, index, count)
+            area.close()
+
+    def read_server_token(self, index, count):
+        with open(self.file.name, "r+b") as f:
+            area = mmap.mmap(f.fileno(), MMAP_SIZE)
+            try:
+                return read_mmap_token(area, index, count)
+            finally:
+                area.close()
+
+    def test_token_round_trip(self):
+        for namespace in (True, False):
+            prefix = "mmap." if namespace else "mmap_"
+            self.write_client_token(0x1234567890, 1000, 16)
+            caps = {
+                prefix+"file"           : self.file.name,
+                prefix+"size"           : MMAP_SIZE,
+                prefix+"token"          : 0x1234567890,
+                prefix+"token_index"    : 1000,
+                prefix+"token_bytes"    : 16,
+                }
+            if namespace:
+                caps["mmap.namespace"] = True
+            c = self.make_connection()
+            c.parse_client_caps(typedict(caps))
+            try:
+                assert c.mmap_size==MMAP_SIZE
+                server_caps = c.get_caps()
+                assert server_caps["mmap_enabled"] is True
+                token = server_caps[prefix+"token"]
+                index = server_caps[prefix+"token_index"]
+                count = server_caps[prefix+"token_bytes"]
+                assert token==c.mmap_client_token
+                #the client can verify the token written by the server:
+                assert self.read_server_token(index, count)==token
+            finally:
+                c.cleanup()
+
+    def test_invalid_token(self):
+        self.write_client_token(1, 0, 16)
+        c = self.make_connection()
+        c.parse_client_caps(typedict({
+            "mmap_file"     : self.file.name,
+            "mmap_token"    : 2,
+            "mmap_token_bytes" : 16,
+            }))
+        assert c.mmap is None and c.mmap_size==0
+        assert c.get_caps()=={"mmap_enabled" : False}
+
+    def test_missing_file(self):
+        c = self.make_connection()
+        c.parse_client_caps(typedict({
+            "mmap_file" : os.path.join(tempfile.gettempdir(), "this-file-should-not-exist"),
+            }))
+        assert c.mmap is None
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,9 @@
 
 import unittest
 
-from xpra.util import AtomicInteger, MutableInteger, typedict, log_screen_sizes, updict, pver, std, alnum, nonl
+from xpra.util import (
+    AtomicInteger, MutableInteger, typedict, log_screen_sizes, updict, flatten_dict, pver, std, alnum, nonl,
+    )
 
 
 class TestIntegerClasses(unittest.TestCase):
@@ -143,6 +145,11 @@ class TestModuleFunctions(unittest.TestCase):
         updict(d, "d3", d3, "hat")
         self.assertEqual(d.get("d3.moo.hat"), "cow")
 
+    def test_flatten_dict(self):
+        d = {"a" : 1, "b" : {"c" : 2, "d" : {"e" : 3}}, "none" : None}
+        self.assertEqual(flatten_dict(d), {"a" : 1, "b.c" : 2, "b.d.e" : 3})
+        self.assertEqual(flatten_dict(d, prefix="p"), flatten_dict({"p" : d}))
+        self.assertEqual(flatten_dict(d, "-", "p"), {"p-a" : 1, "p-b-c" : 2, "p-b-d-e" : 3})
 
     def test_pver(self):
         self.assertEqual(pver(""), "")
@@ -41,6 +41,20 @@ class FakeXineramaTest(unittest.TestCase):
                 fakeXinerama.save_fakeXinerama_config(True, "", (ss, ))
                 fakeXinerama.cleanup_fakeXinerama()
 
+    def test_config_unchanged(self):
+        from xpra.x11 import fakeXinerama
+        monitor = ("plug0", 0, 0, 1920, 1080, 400, 300)
+        ss = ("fake-display", 1920, 1080, 400, 300, (monitor, ), 0, 0, 1920, 1080)
+        try:
+            assert fakeXinerama.save_fakeXinerama_config(True, "", (ss, )) is True
+            with open(fakeXinerama.fakeXinerama_config_files[0], "rb") as f:
+                assert f.read().endswith(b"\n1\n# plug0 (400mm x 300mm)\n0 0 1920 1080\n")
+            #only the numeric values are compared:
+            ss2 = ("fake-display", 1920, 1080, 400, 300, (("plug1", 0, 0, 1920, 1080, 200, 100), ), 0, 0, 1920, 1080)
+            assert fakeXinerama.save_fakeXinerama_config(True, "", (ss2, )) is False
+        finally:
+            fakeXinerama.save_fakeXinerama_config(False)
+
 
 def main():
     #can only work with an X11 server
@@ -7,13 +7,31 @@ import os
 import hmac
 import hashlib
 
-from xpra.util import csv
+from xpra.util import csv, envint
 from xpra.log import Logger
 from xpra.os_util import strtobytes, memoryview_to_bytes, hexstr
 
 log = Logger("network", "crypto")
 
 BLACKLISTED_HASHES = ("sha1", "md5")
+XOR_STR_MIN_SIZE = envint("XPRA_XOR_STR_MIN_SIZE", 64)
+
+try:
+    from xpra.buffers.cyxor import xor_str           #@UnresolvedImport
+except ImportError:
+    log("no cyxor module", exc_info=True)
+    xor_str = None
+
+
+def xor(s1,s2):
+    #truncate to the shortest input just like zip() would:
+    l = min(len(s1), len(s2))
+    if xor_str and l>=XOR_STR_MIN_SIZE:
+        #the native version processes 4 bytes at a time:
+        return memoryview_to_bytes(xor_str(s1[:l], s2[:l]))
+    #let python's long integers do the work in C:
+    v = int.from_bytes(s1[:l], "big") ^ int.from_bytes(s2[:l], "big")
+    return v.to_bytes(l, "big")
 
 
 def get_digests():
@@ -29,7 +47,21 @@ def get_digests():
         pass
     return digests
 
+DIGEST_MODULES = {}
+
 def get_digest_module(digest : str):
+    #the hashlib constructors use the OpenSSL implementations where available,
+    #so we only need to look them up once:
+    try:
+        return DIGEST_MODULES[digest]
+    except (KeyError, TypeError):
+        pass
+    digestmod = do_get_digest_module(digest)
+    if digestmod:
+        DIGEST_MODULES[digest] = digestmod
+    return digestmod
+
+def do_get_digest_module(digest : str):
     log("get_digest_module(%s)", digest)
     if not digest or not digest.startswith("hmac"):
         return None
@@ -71,9 +103,7 @@ def gendigest(digest, password, salt):
         #kerberos, gss and keycloak use xor because we need to use the actual token
         #at the other end
         salt = salt.ljust(len(password), b"\x00")[:len(password)]
-        from xpra.buffers.cyxor import xor_str           #@UnresolvedImport pylint: disable=import-outside-toplevel
-        v = xor_str(password, salt)
-        return memoryview_to_bytes(v)
+        return xor(password, salt)
     digestmod = get_digest_module(digest)
     if not digestmod:
         log("invalid digest module '%s'", digest)
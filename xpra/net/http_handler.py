@@ -4,6 +4,7 @@
 # later version. See the file COPYING for details.
 
 import os
+import hmac
 import glob
 import posixpath
 import mimetypes
@@ -244,7 +245,9 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
         if s.find(":")<0:
             return auth_err("invalid authentication format")
         username, password = s.split(":", 1)
-        if (self.username and username!=self.username) or password!=self.password:
+        #constant time comparison, so we don't leak how much of the password matched:
+        password_ok = hmac.compare_digest(password.encode("utf8"), str(self.password).encode("utf8"))
+        if (self.username and username!=self.username) or not password_ok:
             authlog("http authentication: expected %s:%s but received %s:%s",
                 self.username or "", self.password, username, password)
             return auth_err("invalid credentials")
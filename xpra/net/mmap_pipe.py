@@ -4,7 +4,8 @@
 # later version. See the file COPYING for details.
 
 import os
-from ctypes import c_ubyte, c_char, c_uint32
+from struct import pack_into, unpack_from
+from ctypes import c_char, c_uint32
 
 from xpra.util import roundup
 from xpra.os_util import memoryview_to_bytes, shellsub, get_group_id, WIN32, POSIX
@@ -179,22 +180,14 @@ DEFAULT_TOKEN_BYTES = 128
 
 def write_mmap_token(mmap_area, token, index, count=DEFAULT_TOKEN_BYTES):
     assert count>0
-    #write the token one byte at a time - no endianness
+    #the token is stored in little endian byte order
     log("write_mmap_token(%s, %#x, %#x, %#x)", mmap_area, token, index, count)
-    v = token
-    for i in range(0, count):
-        poke = c_ubyte.from_buffer(mmap_area, index+i)
-        poke.value = v % 256
-        v = v>>8
-    assert v==0, "token value is too big"
+    assert 0<=token and token.bit_length()<=count*8, "token value is too big"
+    pack_into("%is" % count, mmap_area, index, token.to_bytes(count, "little"))
 
 def read_mmap_token(mmap_area, index, count=DEFAULT_TOKEN_BYTES):
     assert count>0
-    v = 0
-    for i in range(0, count):
-        v = v<<8
-        peek = c_ubyte.from_buffer(mmap_area, index+count-1-i)
-        v += peek.value
+    v = int.from_bytes(unpack_from("%is" % count, mmap_area, index)[0], "little")
     log("read_mmap_token(%s, %#x, %#x)=%#x", mmap_area, index, count, v)
     return v
 
@@ -283,6 +276,12 @@ def mmap_write(mmap_area, mmap_size, data):
     mmap_data_end = int_from_buffer(mmap_area, 4)
     start = max(8, mmap_data_start.value)
     end = max(8, mmap_data_end.value)
+    try:
+        #write straight from the pixel buffer, without a temporary copy:
+        data = memoryview(data).cast("B")
+    except TypeError:
+        #ie: non-contiguous buffer or a string
+        data = memoryview(memoryview_to_bytes(data))
     l = len(data)
     log("mmap: start=%i, end=%i, size of data to write=%i", start, end, l)
     if end<start:
@@ -318,7 +317,7 @@ def mmap_write(mmap_area, mmap_size, data):
         #[+++++++++E------------------------]
         #[+++++++++**********E--------------]
         mmap_area.seek(end)
-        mmap_area.write(memoryview_to_bytes(data))
+        mmap_area.write(data)
         chunks = [(end, l)]
         mmap_data_end.value = end+l
     else:
@@ -328,7 +327,7 @@ def mmap_write(mmap_area, mmap_size, data):
             #[------------------S+++++++++E------]
             #[*******E----------S+++++++++-------]
             mmap_area.seek(8)
-            mmap_area.write(memoryview_to_bytes(data))
+            mmap_area.write(data)
             chunks = [(8, l)]
             mmap_data_end.value = 8+l
         else:
@@ -336,9 +335,9 @@ def mmap_write(mmap_area, mmap_size, data):
             #[------------------S+++++++++E------]
             #[******E-----------S+++++++++*******]
             mmap_area.seek(end)
-            mmap_area.write(memoryview_to_bytes(data[:chunk]))
+            mmap_area.write(data[:chunk])
             mmap_area.seek(8)
-            mmap_area.write(memoryview_to_bytes(data[chunk:]))
+            mmap_area.write(data[chunk:])
             l2 = l-chunk
             chunks = [(end, chunk), (8, l2)]
             mmap_data_end.value = 8+l2
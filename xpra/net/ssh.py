@@ -8,6 +8,7 @@ import os
 import re
 import shlex
 import socket
+import select
 from time import sleep, monotonic
 from subprocess import PIPE, Popen
 
@@ -44,7 +45,8 @@ if log.is_debug_enabled():
 
 INITENV_COMMAND = os.environ.get("XPRA_INITENV_COMMAND", "")    #"xpra initenv"
 WINDOW_SIZE = envint("XPRA_SSH_WINDOW_SIZE", 2**27-1)
-TIMEOUT = envint("XPRA_SSH_TIMEOUT", 60)
+#XPRA_SSH_TIMEOUT is the old name for this setting:
+OPEN_CHANNEL_TIMEOUT = envint("XPRA_SSH_OPEN_CHANNEL_TIMEOUT", envint("XPRA_SSH_TIMEOUT", 10))
 
 VERIFY_HOSTKEY = envbool("XPRA_SSH_VERIFY_HOSTKEY", True)
 VERIFY_STRICT = envbool("XPRA_SSH_VERIFY_STRICT", False)
@@ -69,6 +71,9 @@ DEFAULT_WIN32_INSTALL_PATH = "C:\\Program Files\\Xpra"
 
 PARAMIKO_SESSION_LOST = "No existing session"
 
+WIN32_REGISTRY_QUERY = "REG QUERY \"HKEY_LOCAL_MACHINE\\Software\\Xpra\" /v InstallPath"
+INSTALLPATH_RE = re.compile(r"InstallPath\s*\w*\s*(.*)")
+
 
 def keymd5(k) -> str:
     import binascii
@@ -589,6 +594,27 @@ keymd5(host_key),
 
 
     auth_errors = {}
+    session_lost = False
+    allowed_auths = None
+
+    def auth_error(mode, e):
+        nonlocal session_lost, allowed_auths
+        emsg = str(e)
+        auth_errors.setdefault(mode, []).append(emsg)
+        if emsg==PARAMIKO_SESSION_LOST:
+            session_lost = True
+        #BadAuthenticationType tells us which methods the server accepts:
+        allowed_types = getattr(e, "allowed_types", None)
+        if allowed_types:
+            allowed_auths = tuple(allowed_types)
+            log(f"server allows authentication methods: {csv(allowed_auths)}")
+        return emsg
+
+    def auth_allowed(method):
+        if allowed_auths is None or method in allowed_auths:
+            return True
+        log(f"skipping {method!r} authentication, not allowed by the server")
+        return False
 
     def auth_agent():
         agent = Agent()
@@ -603,7 +629,7 @@ keymd5(host_key),
                         log("authenticated using agent and key '%s'", keymd5(agent_key))
                         break
                 except SSHException as e:
-                    auth_errors.setdefault("agent", []).append(str(e))
+                    auth_error("agent", e)
                     log.info("SSH agent key '%s' rejected for user '%s'", keymd5(agent_key), username)
                     log("%s%s", transport.auth_publickey, (username, agent_key), exc_info=True)
                     if str(e)==PARAMIKO_SESSION_LOST:
@@ -672,7 +698,7 @@ keymd5(host_key),
                 try:
                     transport.auth_publickey(username, key)
                 except SSHException as e:
-                    auth_errors.setdefault("key", []).append(str(e))
+                    auth_error("key", e)
                     log(f"key {keyfile_path!r} rejected", exc_info=True)
                     log.info(f"SSH authentication using key {keyfile_path!r} failed:")
                     log.info(f" {e}")
@@ -690,7 +716,7 @@ keymd5(host_key),
         try:
             transport.auth_none(username)
         except SSHException as e:
-            auth_errors.setdefault("none", []).append(str(e))
+            auth_error("none", e)
             log("auth_none()", exc_info=True)
 
     def auth_password():
@@ -698,9 +724,8 @@ keymd5(host_key),
         try:
             transport.auth_password(username, password)
         except SSHException as e:
-            auth_errors.setdefault("password", []).append(str(e))
+            emsgs = auth_error("password", e).split(";")
             log("auth_password(..)", exc_info=True)
-            emsgs = getattr(e, "message", str(e)).split(";")
         else:
             emsgs = []
         if not transport.is_authenticated():
@@ -712,17 +737,15 @@ keymd5(host_key),
 
     def auth_interactive():
         log("trying interactive authentication")
+        myiauthhandler = iauthhandler(password)
         try:
-            myiauthhandler = iauthhandler(password)
             transport.auth_interactive(username, myiauthhandler.handle_request, "")
         except SSHException as e:
-            auth_errors.setdefault("interactive", []).append(str(e))
+            emsgs = auth_error("interactive", e).split(";")
             log("auth_interactive(..)", exc_info=True)
             log.info("SSH password authentication failed:")
-            for emsg in getattr(e, "message", str(e)).split(";"):
+            for emsg in emsgs:
                 log.info(f" {emsg}")
-        finally:
-            del myiauthhandler
 
     banner = transport.get_banner()
     if banner:
@@ -734,18 +757,22 @@ keymd5(host_key),
     auth = list(auth_modes)
     # per the RFC we probably should do none first always and read off the supported
     # methods, however, the current code seems to work fine with OpenSSH
+    # (when the server does tell us which methods it supports, we skip the other ones)
     while not transport.is_authenticated() and auth:
         a = auth.pop(0)
         log("auth=%s", a)
         if a=="none":
             auth_none()
         elif a=="agent":
-            auth_agent()
+            if auth_allowed("publickey"):
+                auth_agent()
         elif a=="key":
-            auth_publickey()
+            if auth_allowed("publickey"):
+                auth_publickey()
         elif a=="password":
-            auth_interactive()
-            if not transport.is_authenticated():
+            if auth_allowed("keyboard-interactive"):
+                auth_interactive()
+            if not transport.is_authenticated() and auth_allowed("password"):
                 if password:
                     auth_password()
                 else:
@@ -761,10 +788,8 @@ keymd5(host_key),
             log.warn(f"Warning: invalid authentication mechanism {a}")
         #detect session-lost problems:
         #(no point in continuing without a session)
-        if auth_errors and not transport.is_authenticated():
-            for err_strs in auth_errors.values():
-                if PARAMIKO_SESSION_LOST in err_strs:
-                    raise SSHAuthenticationError(host, auth_errors)
+        if session_lost and not transport.is_authenticated():
+            raise SSHAuthenticationError(host, auth_errors)
     if not transport.is_authenticated():
         transport.close()
         log(f"authentication errors: {auth_errors}")
@@ -776,11 +801,25 @@ class SSHAuthenticationError(InitExit):
         super().__init__(EXIT_CONNECTION_FAILED, f"SSH Authentication failed for {host!r}")
         self.errors = errors
 
-def paramiko_run_test_command(transport, cmd):
+def get_open_channel_timeout(paramiko_config=None) -> int:
+    v = (paramiko_config or {}).get("open-channel-timeout")
+    if v is None:
+        return OPEN_CHANNEL_TIMEOUT
+    try:
+        timeout = int(v)
+    except (TypeError, ValueError):
+        timeout = 0
+    if timeout<=0:
+        log.warn(f"Warning: invalid 'open-channel-timeout' value {v!r}")
+        log.warn(f" using the default: {OPEN_CHANNEL_TIMEOUT} seconds")
+        return OPEN_CHANNEL_TIMEOUT
+    return timeout
+
+def paramiko_run_test_command(transport, cmd, open_channel_timeout=OPEN_CHANNEL_TIMEOUT):
     from paramiko import SSHException
-    log(f"paramiko_run_test_command(transport, {cmd})")
+    log(f"paramiko_run_test_command(transport, {cmd}, {open_channel_timeout})")
     try:
-        chan = transport.open_session(window_size=None, max_packet_size=0, timeout=60)
+        chan = transport.open_session(window_size=None, max_packet_size=0, timeout=open_channel_timeout)
         chan.set_name(f"run-test:{cmd}")
     except SSHException as e:
         log("open_session", exc_info=True)
@@ -796,18 +835,27 @@ def paramiko_run_test_command(transport, cmd):
         sleep(0.01)
     code = chan.recv_exit_status()
     log(f"exec_command({cmd!r})={code}")
-    def chan_read(read_fn):
-        try:
-            return read_fn()
-        except socket.error:
-            log(f"chan_read({read_fn})", exc_info=True)
-            return b""
-    #don't wait too long for the data:
-    chan.settimeout(EXEC_STDOUT_TIMEOUT)
-    out = chan_read(chan.makefile().readlines)
+    def chan_read(ready_fn, recv_fn, timeout):
+        #drain what is already buffered,
+        #then only wait for late data until the timeout expires:
+        data = []
+        end = monotonic()+timeout
+        while True:
+            eof = chan.eof_received
+            try:
+                while ready_fn():
+                    data.append(recv_fn(65536))
+            except socket.error:
+                log(f"chan_read({recv_fn})", exc_info=True)
+                break
+            remaining = end-monotonic()
+            if eof or remaining<=0:
+                break
+            select.select([chan], [], [], min(remaining, 0.05))
+        return b"".join(data).decode("utf8", "replace").splitlines(True)
+    out = chan_read(chan.recv_ready, chan.recv, EXEC_STDOUT_TIMEOUT)
     log(f"exec_command out={out!r}")
-    chan.settimeout(EXEC_STDERR_TIMEOUT)
-    err = chan_read(chan.makefile_stderr().readlines)
+    err = chan_read(chan.recv_stderr_ready, chan.recv_stderr, EXEC_STDERR_TIMEOUT)
     log(f"exec_command err={err!r}")
     chan.close()
     return out, err, code
@@ -818,27 +866,27 @@ def paramiko_run_remote_xpra(transport, xpra_proxy_command=None, remote_xpra=Non
     from paramiko import SSHException
     assert remote_xpra
     log(f"will try to run xpra from: {remote_xpra}")
+    open_channel_timeout = get_open_channel_timeout(paramiko_config)
     def rtc(cmd):
-        return paramiko_run_test_command(transport, cmd)
+        return paramiko_run_test_command(transport, cmd, open_channel_timeout)
     def detectosname():
-        #first, try a syntax that should work with any ssh server:
-        r = rtc("echo %OS%")
-        if r[2]==0 and r[0]:
-            name = r[0][-1].rstrip("\n\r")
-            log(f"echo %OS%={name!r}")
-            if name!="%OS%":
-                #MS Windows OS will return "Windows_NT" here
-                log.info(f"ssh server OS is {name!r}")
-                return name
-        #this should work on all other OSes:
-        r = rtc("echo $OSTYPE")
-        if r[2]==0 and r[0]:
-            name = r[0][-1].rstrip("\n\r")
-            log(f"OSTYPE={name!r}")
-            log.info(f"ssh server OS is {name!r}")
-            return name
-        return "unknown"
-    WIN32_REGISTRY_QUERY = "REG QUERY \"HKEY_LOCAL_MACHINE\\Software\\Xpra\" /v InstallPath"
+        #a single probe which should work with any ssh server,
+        #MS Windows servers will fail to run 'uname' and echo "Windows_NT" instead:
+        r = rtc("uname -s 2>/dev/null || echo %OS%")
+        if r[2]!=0 or not r[0]:
+            return "unknown"
+        name = r[0][-1].rstrip("\n\r")
+        log(f"uname -s || echo %OS%={name!r}")
+        if not name or name=="%OS%":
+            return "unknown"
+        uname = name.upper()
+        #map the MSYS2 and Cygwin kernel names to the values used by $OSTYPE:
+        if uname.startswith("MINGW") or uname.startswith("MSYS"):
+            name = "msys"
+        elif uname.startswith("CYGWIN"):
+            name = "cygwin"
+        log.info(f"ssh server OS is {name!r}")
+        return name
     def getexeinstallpath():
         cmd = WIN32_REGISTRY_QUERY
         if osname=="msys":
@@ -848,40 +896,75 @@ def paramiko_run_remote_xpra(transport, xpra_proxy_command=None, remote_xpra=Non
         if r[2]!=0:
             return None
         for line in r[0]:
-            qmatch = re.search(r"InstallPath\s*\w*\s*(.*)", line)
+            qmatch = INSTALLPATH_RE.search(line)
             if qmatch:
                 return qmatch.group(1).rstrip("\n\r")
         return None
+    def winpath(p):
+        if osname=="msys":
+            return p.replace("\\", "\\\\")
+        if osname=="cygwin":
+            return "/cygdrive/"+p.replace(":\\", "/").replace("\\", "/")
+        return p
     osname = detectosname()
-    tried = set()
+    #these probes do not depend on the command we are looking for,
+    #so run them just once rather than for every candidate:
+    is_win32 = osname.startswith("Windows") or osname in ("msys", "cygwin")
+    installpath = None
+    if is_win32:
+        #on MS Windows,
+        #always prefer the application path found in the registry:
+        installpath = getexeinstallpath()
     find_command = None
+    if not installpath and not osname.startswith("Windows"):
+        if rtc("command")[2]==0:
+            find_command = "command -v"
+        else:
+            find_command = "which"
+    #the arguments are the same for all the candidates:
+    xpra_args = ' '.join(shellquote(x) for x in xpra_proxy_command)
+    if socket_dir:
+        xpra_args += f" \"--socket-dir={socket_dir}\""
+    if display_as_args:
+        xpra_args += " "
+        xpra_args += " ".join(shellquote(x) for x in display_as_args)
+    def run_xpra(xpra_cmd):
+        cmd = '"' + xpra_cmd + '" ' + xpra_args
+        log(f"cmd({xpra_proxy_command}, {display_as_args})={cmd}")
+
+        #see https://github.com/paramiko/paramiko/issues/175
+        #WINDOW_SIZE = 2097152
+        log(f"trying to open SSH session, window-size={WINDOW_SIZE}, timeout={open_channel_timeout}")
+        try:
+            chan = transport.open_session(window_size=WINDOW_SIZE, max_packet_size=0, timeout=open_channel_timeout)
+            chan.set_name("run-xpra")
+        except SSHException as e:
+            log("open_session", exc_info=True)
+            raise InitExit(EXIT_SSH_FAILURE, f"failed to open SSH session: {e}") from None
+        agent_option = str((paramiko_config or {}).get("agent", SSH_AGENT)) or "no"
+        log(f"paramiko agent_option={agent_option}")
+        if agent_option.lower() in TRUE_OPTIONS:
+            log.info("paramiko SSH agent forwarding enabled")
+            from paramiko.agent import AgentRequestHandler
+            AgentRequestHandler(chan)
+        log(f"channel exec_command({cmd!r})")
+        chan.exec_command(cmd)
+        return chan
+    if installpath:
+        #the registry tells us where xpra is installed,
+        #so there is no need to probe any of the candidates:
+        return run_xpra(winpath(f"{installpath}\\Xpra_cmd.exe"))
+    tried = set()
     for xpra_cmd in remote_xpra:
         found = False
-        if osname.startswith("Windows") or osname in ("msys", "cygwin"):
-            #on MS Windows,
-            #always prefer the application path found in the registry:
-            def winpath(p):
-                if osname=="msys":
-                    return p.replace("\\", "\\\\")
-                if osname=="cygwin":
-                    return "/cygdrive/"+p.replace(":\\", "/").replace("\\", "/")
-                return p
-            installpath = getexeinstallpath()
-            if installpath:
-                xpra_cmd = winpath(f"{installpath}\\Xpra_cmd.exe")
-                found = True
-            elif xpra_cmd.find("/")<0 and xpra_cmd.find("\\")<0:
+        if is_win32:
+            if xpra_cmd.find("/")<0 and xpra_cmd.find("\\")<0:
                 test_path = winpath(f"{DEFAULT_WIN32_INSTALL_PATH}\\{xpra_cmd}")
                 cmd = f'dir "{test_path}"'
                 r = rtc(cmd)
                 if r[2]==0:
                     xpra_cmd = test_path
                     found = True
-        if not found and not find_command and not osname.startswith("Windows"):
-            if rtc("command")[2]==0:
-                find_command = "command -v"
-            else:
-                find_command = "which"
         if not found and find_command:
             r = rtc(f"{find_command} {xpra_cmd}")
             out = r[0]
@@ -908,33 +991,7 @@ def paramiko_run_remote_xpra(transport, xpra_proxy_command=None, remote_xpra=Non
             continue
         log(f"adding xpra_cmd={xpra_cmd!r}")
         tried.add(xpra_cmd)
-        cmd = '"' + xpra_cmd + '" ' + ' '.join(shellquote(x) for x in xpra_proxy_command)
-        if socket_dir:
-            cmd += f" \"--socket-dir={socket_dir}\""
-        if display_as_args:
-            cmd += " "
-            cmd += " ".join(shellquote(x) for x in display_as_args)
-        log(f"cmd({xpra_proxy_command}, {display_as_args})={cmd}")
-
-        #see https://github.com/paramiko/paramiko/issues/175
-        #WINDOW_SIZE = 2097152
-        log(f"trying to open SSH session, window-size={WINDOW_SIZE}, timeout={TIMEOUT}")
-        try:
-            chan = transport.open_session(window_size=WINDOW_SIZE, max_packet_size=0, timeout=TIMEOUT)
-            chan.set_name("run-xpra")
-        except SSHException as e:
-            log("open_session", exc_info=True)
-            raise InitExit(EXIT_SSH_FAILURE, f"failed to open SSH session: {e}") from None
-        else:
-            agent_option = str((paramiko_config or {}).get("agent", SSH_AGENT)) or "no"
-            log(f"paramiko agent_option={agent_option}")
-            if agent_option.lower() in TRUE_OPTIONS:
-                log.info("paramiko SSH agent forwarding enabled")
-                from paramiko.agent import AgentRequestHandler
-                AgentRequestHandler(chan)
-            log(f"channel exec_command({cmd!r})")
-            chan.exec_command(cmd)
-            return chan
+        return run_xpra(xpra_cmd)
     raise Exception("all SSH remote proxy commands have failed - is xpra installed on the remote host?")
 
 
@@ -979,22 +1036,20 @@ def ssh_exec_connect_to(display_desc, opts=None, debug_cb=None, ssh_fail_cb=ssh_
         socket_dir = display_desc.get("socket_dir")
         proxy_command = display_desc["proxy_command"]       #ie: "_proxy_start"
         display_as_args = display_desc["display_as_args"]   #ie: "--start=xterm :10"
-        remote_cmd = ""
+        quoted_args = [shellquote(x) for x in display_as_args]
+        socket_dir_args = [f"--socket-dir={socket_dir}"] if socket_dir else []
+        checks = []
         for x in remote_xpra:
-            if not remote_cmd:
-                check = "if"
-            else:
-                check = "elif"
+            check = "elif" if checks else "if"
             if x=="xpra":
                 #no absolute path, so use "command -v" to check that the command exists:
                 pc = [f'{check} command -v "{x}" > /dev/null 2>&1; then']
             else:
                 pc = [f'{check} [ -x {x} ]; then']
-            pc += [x] + proxy_command + [shellquote(x) for x in display_as_args]
-            if socket_dir:
-                pc.append(f"--socket-dir={socket_dir}")
-            remote_cmd += " ".join(pc)+";"
-        remote_cmd += "else echo \"no run-xpra command found\"; exit 1; fi"
+            pc += [x] + proxy_command + quoted_args + socket_dir_args
+            checks.append(" ".join(pc))
+        checks.append("else echo \"no run-xpra command found\"; exit 1; fi")
+        remote_cmd = ";".join(checks)
         if INITENV_COMMAND:
             remote_cmd = INITENV_COMMAND + ";" + remote_cmd
         #how many times we need to escape the remote command string
@@ -1032,7 +1087,7 @@ def ssh_exec_connect_to(display_desc, opts=None, debug_cb=None, ssh_fail_cb=ssh_
         kwargs["env"] = restore_script_env(env)
 
         if is_debug_enabled("ssh"):
-            log.info("executing ssh command: " + " ".join(f"\"{x}\"" for x in cmd))
+            log.info("executing ssh command: %s", " ".join(f"\"{x}\"" for x in cmd))
         child = Popen(cmd, stdin=PIPE, stdout=PIPE, **kwargs)
     except OSError as e:
         cmd_info = " ".join(repr(x) for x in cmd)
@@ -1120,16 +1175,30 @@ def ssh_exec_connect_to(display_desc, opts=None, debug_cb=None, ssh_fail_cb=ssh_
     if kwargs.get("stderr")==PIPE:
         def stderr_reader():
             errs = []
+            fd = child.stderr.fileno()
+            buf = bytearray()
             while child.poll() is None:
                 try:
-                    v = child.stderr.readline()
+                    v = os.read(fd, 4096)
                 except OSError:
                     log("stderr_reader()", exc_info=True)
                     break
                 if not v:
                     log(f"SSH EOF on stderr of {cmd}")
                     break
-                s = bytestostr(v.rstrip(b"\n\r"))
+                buf += v
+                #only process complete lines:
+                eol = buf.rfind(b"\n")
+                if eol<0:
+                    continue
+                lines = buf[:eol].splitlines()
+                del buf[:eol+1]
+                for line in lines:
+                    s = bytestostr(bytes(line.rstrip(b"\r")))
+                    if s:
+                        errs.append(s)
+            if buf:
+                s = bytestostr(bytes(buf.rstrip(b"\n\r")))
                 if s:
                     errs.append(s)
             if errs:
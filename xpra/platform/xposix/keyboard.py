@@ -5,6 +5,7 @@
 # later version. See the file COPYING for details.
 
 import os
+import mmap
 
 from xpra.platform.keyboard_base import KeyboardBase
 from xpra.keyboard.mask import MODIFIER_MAP
@@ -31,6 +32,7 @@ class Keyboard(KeyboardBase):
     def init_vars(self):
         super().init_vars()
         self.keymap_modifiers = None
+        self.xkb_rules_names = None
         self.keyboard_bindings = None
 
     def __repr__(self):
@@ -84,8 +86,13 @@ class Keyboard(KeyboardBase):
         # System Locale: LANG=en_GB.UTF-8
         # VC Keymap: gb
         # X11 Layout: gb
-        from subprocess import getoutput
-        out = getoutput("localectl status")
+        from subprocess import run, PIPE, TimeoutExpired  #pylint: disable=import-outside-toplevel
+        try:
+            #no need for a shell:
+            out = run(["localectl", "status"], stdout=PIPE, stderr=PIPE, timeout=2, check=False).stdout
+        except (OSError, TimeoutExpired):
+            log("get_locale_status()", exc_info=True)
+            return {}
         if not out:
             return {}
         locale = {}
@@ -114,6 +121,15 @@ class Keyboard(KeyboardBase):
 
 
     def get_xkb_rules_names_property(self):
+        xkb_rules_names = self.xkb_rules_names
+        if not xkb_rules_names:
+            xkb_rules_names = self.do_get_xkb_rules_names_property()
+            #only cache valid values, so we can try again:
+            if xkb_rules_names:
+                self.xkb_rules_names = xkb_rules_names
+        return xkb_rules_names
+
+    def do_get_xkb_rules_names_property(self):
         #parses the "_XKB_RULES_NAMES" X11 property
         if not is_X11():
             return ""
@@ -138,14 +154,26 @@ class Keyboard(KeyboardBase):
             except ImportError:
                 log("cannot parse xml", exc_info=True)
             else:
-                with open(repository, "r", encoding="latin1") as f:
-                    tree = lxml.etree.parse(f)  #pylint: disable=c-extension-no-member
                 x11_layouts = {}
-                for layout in tree.xpath("//layout"):
-                    layout = layout.xpath("./configItem/name")[0].text
-                    x11_layouts[layout] = layout
-                    #for variant in layout.xpath("./variantList/variant/configItem/name"):
-                    #    variant_name = variant.text
+                def parse_layouts(source):
+                    #pylint: disable=c-extension-no-member
+                    for _, elem in lxml.etree.iterparse(source, tag="layout"):
+                        name = elem.find("./configItem/name")
+                        if name is not None:
+                            x11_layouts[name.text] = name.text
+                        #for variant in elem.xpath("./variantList/variant/configItem/name"):
+                        #    variant_name = variant.text
+                        elem.clear()
+                with open(repository, "rb") as f:
+                    try:
+                        #let the kernel page in the file lazily:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    except (OSError, ValueError):
+                        log("mmap(%s)", repository, exc_info=True)
+                        parse_layouts(f)
+                    else:
+                        with mm:
+                            parse_layouts(mm)
                 return x11_layouts
         from subprocess import Popen, PIPE  #pylint: disable=import-outside-toplevel
         try:
@@ -220,6 +248,7 @@ class Keyboard(KeyboardBase):
             self.modifier_map = MODIFIER_MAP
         #force re-query on next call:
         self.keymap_modifiers = None
+        self.xkb_rules_names = None
         try:
             dn = "%s %s" % (type(display).__name__, display.get_name())
         except Exception:
@@ -19,7 +19,8 @@ class Authenticator(FileAuthenticatorBase):
             return None
         salt = self.get_response_salt(client_salt)
         password = self.get_password()
-        log("authenticate_hmac() get_password()=%s", obsc(password))
+        if log.is_debug_enabled():
+            log("authenticate_hmac() get_password()=%s", obsc(password))
         if not password:
             log.warn("Warning: authentication failed")
             log.warn(" no password for '%s' in '%s'", self.username, self.password_filename)
@@ -6,8 +6,8 @@
 
 import sys
 
-from xpra.server.auth.sys_auth_base import SysAuthenticatorBase, xor, log, parse_uid, parse_gid
-from xpra.net.digest import get_salt, get_digests, gendigest
+from xpra.server.auth.sys_auth_base import SysAuthenticatorBase, log, parse_uid, parse_gid
+from xpra.net.digest import get_salt, get_digests, gendigest, xor
 from xpra.util import typedict
 from xpra.os_util import WIN32
 
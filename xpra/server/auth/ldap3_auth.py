@@ -6,13 +6,53 @@
 
 import os
 import sys
+from hashlib import sha256
+from time import monotonic
+from threading import Lock, BoundedSemaphore
+from collections import OrderedDict
 
-from xpra.util import obsc, typedict
+from xpra.util import envint, envbool, noerr, obsc, typedict
+from xpra.net.digest import get_salt
 from xpra.server.auth.sys_auth_base import SysAuthenticatorBase, log, parse_uid, parse_gid
-from xpra.log import enable_debug_for, is_debug_enabled
+from xpra.log import enable_debug_for
 assert log #tests will disable logging from here
 
 LDAP_CACERTFILE = os.environ.get("XPRA_LDAP_CACERTFILE")
+LDAP_DUMP_INFO = envbool("XPRA_LDAP_DUMP_INFO", False)
+LDAP_POOL_SIZE = envint("XPRA_LDAP_POOL_SIZE", 8)
+LDAP_CONCURRENCY = envint("XPRA_LDAP_CONCURRENCY", 16)
+LDAP_CONCURRENCY_TIMEOUT = envint("XPRA_LDAP_CONCURRENCY_TIMEOUT", 10)
+LDAP_NEG_CACHE_TTL = envint("XPRA_LDAP_NEG_CACHE_TTL", 10)
+LDAP_NEG_CACHE_SIZE = envint("XPRA_LDAP_NEG_CACHE_SIZE", 4096)
+
+#idle connections, indexed by server and TLS settings,
+#so we don't need a new TCP connection and TLS handshake for every login:
+CONNECTION_POOL = {}
+CONNECTION_POOL_LOCK = Lock()
+BIND_SEMAPHORES = {}
+#recently rejected credentials, so clients retrying the same bad password
+#don't cost us an ldap round-trip every time:
+#(only a hash of the password is ever stored here)
+FAILED_BINDS = OrderedDict()
+FAILED_BINDS_LOCK = Lock()
+
+try:
+    from ldap3 import Server, Connection, Tls, ALL, NONE, ANONYMOUS, SIMPLE, SASL, NTLM     #@UnresolvedImport
+    from ldap3.core.exceptions import LDAPCommunicationError, LDAPBindError     #@UnresolvedImport
+    MECHANISM = {
+        "SIMPLE"    : SIMPLE,
+        "SASL"      : SASL,
+        "NTLM"      : NTLM,
+        }
+    #the errors we get when the server has closed an idle connection,
+    #(ie: LDAPSessionTerminatedByServerError, or `rebind` wraps
+    # socket receive errors in an LDAPBindError)
+    LDAP_CONNECTION_ERRORS = (LDAPCommunicationError, LDAPBindError)
+    LDAP3_IMPORT_ERROR = None
+except ImportError as e:
+    MECHANISM = {}
+    LDAP_CONNECTION_ERRORS = ()
+    LDAP3_IMPORT_ERROR = e
 
 
 class Authenticator(SysAuthenticatorBase):
@@ -39,9 +79,36 @@ class Authenticator(SysAuthenticatorBase):
         self.authentication = kwargs.pop("authentication", "NTLM").upper()
         assert self.authentication in ("SIMPLE", "SASL", "NTLM"), \
             "invalid authentication mechanism '%s'" % self.authentication
+        self.auth_mechanism = MECHANISM.get(self.authentication)
+        self.pool_size = int(kwargs.pop("pool-size", LDAP_POOL_SIZE))
+        self.concurrency = max(1, int(kwargs.pop("concurrency", LDAP_CONCURRENCY)))
         super().__init__(**kwargs)
         log("ldap auth: host=%s, port=%i, tls=%s",
             self.host, self.port, self.tls)
+        self.server = None
+        if not LDAP3_IMPORT_ERROR:
+            self.server = self.make_server()
+        #these settings don't change for the lifetime of this authenticator,
+        #so resolve everything the check() path needs just once:
+        self.pool_key = self.get_pool_key()
+        with CONNECTION_POOL_LOCK:
+            self.bind_semaphore = BIND_SEMAPHORES.setdefault(self.pool_key, BoundedSemaphore(self.concurrency))
+        self.failed_bind_hash = sha256()
+        for x in self.pool_key+(self.username, self.authentication):
+            self.failed_bind_hash.update(str(x).encode("utf8")+b"\0")
+
+    def make_server(self):
+        tls = None
+        if self.tls:
+            tls = Tls(validate=self.tls_validate, version=self.tls_version, ca_certs_file=self.cacert)
+            log("TLS=%s", tls)
+        #only download the server information if we are going to log it:
+        get_info = ALL if LDAP_DUMP_INFO else NONE
+        #`use_ssl` negotiates TLS as soon as we connect,
+        #so we don't need an extra round-trip for `start_tls`:
+        server = Server(self.host, port=self.port, tls=tls, use_ssl=self.tls, get_info=get_info)
+        log("ldap3 Server(%s)=%s", (self.host, self.port, self.tls), server)
+        return server
 
     def get_uid(self) -> int:
         return self.uid
@@ -56,55 +123,170 @@ class Authenticator(SysAuthenticatorBase):
         if "xor" not in digests:
             log.error("Error: ldap authentication requires the 'xor' digest")
             return None
-        return super().get_challenge(["xor"])
+        #xor is the only digest we can use, no need for choose_digest():
+        if self.salt is not None:
+            log.error("Error: authentication challenge already sent!")
+            return None
+        self.salt = get_salt()
+        self.digest = "xor"
+        self.challenge_sent = True
+        return self.salt, self.digest
 
     def check(self, password) -> bool:
-        log("check(%s)", obsc(password))
-        try:
-            from ldap3 import Server, Connection, Tls, ALL, SIMPLE, SASL, NTLM     #@UnresolvedImport
-        except ImportError as e:
-            log("check(..)", exc_info=True)
+        if log.is_debug_enabled():
+            log("check(%s)", obsc(password))
+        if LDAP3_IMPORT_ERROR:
             log.warn("Warning: cannot use ldap3 authentication:")
-            log.warn(" %s", e)
+            log.warn(" %s", LDAP3_IMPORT_ERROR)
+            return False
+        key = self.get_failed_bind_key(password)
+        if self.recently_failed(key):
+            log("ldap3 check: credentials for '%s' were rejected recently", self.username)
+            return False
+        #authentication runs in its own thread for each connection,
+        #limit how many of those can hit the ldap server at the same time:
+        sem = self.bind_semaphore
+        if not sem.acquire(timeout=LDAP_CONCURRENCY_TIMEOUT):
+            log.warn("Warning: ldap3 authentication timed out")
+            log.warn(" too many concurrent authentication requests")
             return False
         try:
-            MECHANISM = {
-                "SIMPLE"    : SIMPLE,
-                "SASL"      : SASL,
-                "NTLM"      : NTLM,
-                }
-            authentication = MECHANISM[self.authentication]
-            tls = None
-            if self.tls:
-                tls = Tls(validate=self.tls_validate, version=self.tls_version, ca_certs_file=self.cacert)
-                log("TLS=%s", tls)
-            server = Server(self.host, port=self.port, tls=tls, use_ssl=self.tls, get_info=ALL)
-            log("ldap3 Server(%s)=%s", (self.host, self.port, self.tls), server)
-            conn = Connection(server, user=self.username, password=password,
-                              authentication=authentication, receive_timeout=10)
-            log("ldap3 Connection(%s, %s, %s)=%s", server, self.username, self.authentication, conn)
-            if self.tls:
-                conn.start_tls()
-            r = conn.bind()
-            log("ldap3 %s.bind()=%s", conn, r)
-            if not r:
+            r, rejected = self.do_check(password)
+        finally:
+            sem.release()
+        self.record_bind(key, r, rejected)
+        return r
+
+    def get_failed_bind_key(self, password):
+        if LDAP_NEG_CACHE_TTL<=0:
+            return None
+        h = self.failed_bind_hash.copy()
+        if isinstance(password, str):
+            password = password.encode("utf8")
+        h.update(password)
+        return h.digest()
+
+    def recently_failed(self, key) -> bool:
+        if key is None:
+            return False
+        with FAILED_BINDS_LOCK:
+            entry = FAILED_BINDS.get(key)
+            if entry is None:
                 return False
-            if is_debug_enabled("auth"):
-                log("ldap3 server info:")
-                for l in server.info.splitlines():
-                    log(" %s", l)
+            if monotonic()-entry[0]<LDAP_NEG_CACHE_TTL:
+                return True
+            del FAILED_BINDS[key]
+        return False
+
+    def record_bind(self, key, success, rejected):
+        if key is None:
+            return
+        with FAILED_BINDS_LOCK:
+            if success:
+                #the user got it right, forget about all the previous failures:
+                user = self.username
+                for k, v in tuple(FAILED_BINDS.items()):
+                    if v[1]==user:
+                        del FAILED_BINDS[k]
+            elif rejected:
+                #only cache actual rejections, not connection errors:
+                FAILED_BINDS[key] = (monotonic(), self.username)
+                FAILED_BINDS.move_to_end(key)
+                while len(FAILED_BINDS)>LDAP_NEG_CACHE_SIZE:
+                    FAILED_BINDS.popitem(last=False)
+
+    def do_check(self, password):
+        """
+            returns a tuple: (success, rejected)
+            `rejected` is only set if the server refused the credentials
+        """
+        conn = None
+        try:
+            conn, pooled = self.acquire_connection()
+            try:
+                r = self.bind(conn, password)
+            except LDAP_CONNECTION_ERRORS as e:
+                if not pooled:
+                    raise
+                #the server may have closed this connection while it was idle,
+                #so try again just once, with a new connection:
+                log("ldap3 pooled connection %s failed: %s", conn, e)
+                noerr(conn.unbind)
+                conn = None
+                conn = self.new_connection()
+                r = self.bind(conn, password)
+            if not r:
+                return False, True
+            if LDAP_DUMP_INFO and conn.server.info:
+                log.info("ldap3 server info:\n%s", conn.server.info)
             log("ldap3 who_am_i()=%s", conn.extend.standard.who_am_i())
-            return True
+            return True, False
         except Exception as e:
             log("ldap3 check(..)", exc_info=True)
             log.error("Error: ldap3 authentication failed:")
             log.error(" %s", e)
-            return False
+            if conn:
+                #don't put a broken connection back in the pool:
+                noerr(conn.unbind)
+                conn = None
+            return False, False
+        finally:
+            if conn:
+                self.release_connection(conn)
+
+    def bind(self, conn, password) -> bool:
+        r = conn.rebind(user=self.username, password=password, authentication=self.auth_mechanism)
+        log("ldap3 %s.rebind(%s, %s)=%s", conn, self.username, self.authentication, r)
+        return r
+
+    def get_pool_key(self):
+        return (self.host, self.port, self.tls, self.cacert, self.tls_version, self.tls_validate)
+
+    def acquire_connection(self):
+        """
+            returns a tuple: (connection, pooled)
+        """
+        with CONNECTION_POOL_LOCK:
+            pool = CONNECTION_POOL.get(self.pool_key)
+            while pool:
+                conn = pool.pop()
+                if not conn.closed:
+                    log("ldap3 re-using pooled connection %s", conn)
+                    return conn, True
+        return self.new_connection(), False
+
+    def new_connection(self):
+        conn = Connection(self.server, receive_timeout=10)
+        log("ldap3 Connection(%s)=%s", self.server, conn)
+        conn.open()
+        return conn
+
+    def release_connection(self, conn):
+        #don't keep the user's credentials around in idle connections:
+        conn.user = None
+        conn.password = None
+        with CONNECTION_POOL_LOCK:
+            pool = CONNECTION_POOL.setdefault(self.pool_key, [])
+            full = len(pool)>=self.pool_size
+        if not full and not conn.closed:
+            #and don't leave the connection bound as this user either:
+            try:
+                r = conn.rebind(authentication=ANONYMOUS, read_server_info=False)
+            except Exception as e:
+                log("ldap3 anonymous rebind of %s failed: %s", conn, e)
+                r = False
+            if r:
+                with CONNECTION_POOL_LOCK:
+                    pool = CONNECTION_POOL.setdefault(self.pool_key, [])
+                    if len(pool)<self.pool_size:
+                        pool.append(conn)
+                        return
+        noerr(conn.unbind)
 
 
 def main(argv):
     #pylint: disable=import-outside-toplevel
-    from xpra.net.digest import get_salt, get_digests, gendigest
+    from xpra.net.digest import get_digests, gendigest
     from xpra.platform import program_context
     with program_context("LDAP3-Password-Auth", "LDAP3-Password-Authentication"):
         for x in list(argv):
@@ -57,7 +57,8 @@ class Authenticator(SysAuthenticatorBase):
         return super().get_challenge(["xor"])
 
     def check(self, password) -> bool:
-        log("check(%s)", obsc(password))
+        if log.is_debug_enabled():
+            log("check(%s)", obsc(password))
         def emsg(e):
             try:
                 log.warn(" LDAP Error: %s", e.message["desc"])
@@ -106,7 +107,8 @@ class Authenticator(SysAuthenticatorBase):
             except Exception:
                 pass
             v = conn.simple_bind_s(user, password)
-            log("simple_bind_s(%s, %s)=%s", user, obsc(password), v)
+            if log.is_debug_enabled():
+                log("simple_bind_s(%s, %s)=%s", user, obsc(password), v)
             return True
         except INVALID_CREDENTIALS:
             log("check(..)", exc_info=True)
@@ -73,11 +73,13 @@ class Authenticator(SysAuthenticator):
         return self.salt, self.digest
 
     def check(self, password) -> bool:
-        log("otp.check(%s)", obsc(password))
+        if log.is_debug_enabled():
+            log("otp.check(%s)", obsc(password))
         import pyotp
         totp = pyotp.TOTP(self.secret)
         r = totp.verify(bytestostr(password), valid_window=self.valid_window)
-        log("otp.check(%s)=%s", obsc(password), r)
+        if log.is_debug_enabled():
+            log("otp.check(%s)=%s", obsc(password), r)
         if not r:
             raise Exception("invalid OTP value")
         return True
@@ -4,6 +4,8 @@
 # later version. See the file COPYING for details.
 
 import os
+from time import monotonic
+from threading import Lock
 from collections import deque
 
 from xpra.platform.info import get_username
@@ -12,28 +14,93 @@ from xpra.platform.paths import get_socket_dirs
 from xpra.util import envint, obsc, typedict, std
 from xpra.scripts.config import TRUE_OPTIONS
 from xpra.net.digest import get_salt, choose_digest, verify_digest, gendigest
-from xpra.os_util import hexstr, POSIX
+from xpra.os_util import hexstr, memoryview_to_bytes, POSIX
 from xpra.log import Logger
 log = Logger("auth")
 
 USED_SALT_CACHE_SIZE = envint("XPRA_USED_SALT_CACHE_SIZE", 1024*1024)
+NSS_CACHE_TTL = envint("XPRA_AUTH_NSS_CACHE_TTL", 30)
 DEFAULT_UID = os.environ.get("XPRA_AUTHENTICATION_DEFAULT_UID", "nobody")
 DEFAULT_GID = os.environ.get("XPRA_AUTHENTICATION_DEFAULT_GID", "nobody")
 
 
-def xor(s1,s2):
-    return b"".join(b"%c" % (a ^ b) for a,b in zip(s1,s2))
+class SaltCache:
+    """
+        Remembers the last `maxlen` salts,
+        using a set so that membership checks are not O(n).
+    """
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self.salts = set()
+        self.order = deque()
+
+    @staticmethod
+    def key(salt) -> bytes:
+        #hmac digests are hex encoded,
+        #storing the raw bytes halves the memory used and the hashing cost:
+        if isinstance(salt, str):
+            try:
+                return bytes.fromhex(salt)
+            except ValueError:
+                return salt.encode("utf8")
+        return memoryview_to_bytes(salt)
+
+    def __contains__(self, salt) -> bool:
+        return self.key(salt) in self.salts
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def append(self, salt):
+        salt = self.key(salt)
+        if salt in self.salts:
+            return
+        self.salts.add(salt)
+        self.order.append(salt)
+        if len(self.order)>self.maxlen:
+            self.salts.discard(self.order.popleft())
+
+
+nss_cache = {}
+nss_cache_lock = Lock()
+
+def nss_lookup(fn, name):
+    #the password and group databases can be backed by slow network services,
+    #so keep successful lookups for a little while:
+    now = monotonic()
+    key = (fn, name)
+    with nss_cache_lock:
+        cached = nss_cache.get(key)
+    if cached and now-cached[1]<NSS_CACHE_TTL:
+        return cached[0]
+    value = fn(name)
+    with nss_cache_lock:
+        nss_cache[key] = (value, now)
+    return value
+
+def getpwnam(name):
+    import pwd  #pylint: disable=import-outside-toplevel
+    return nss_lookup(pwd.getpwnam, name)
+
+def getgrnam(name):
+    import grp  #@UnresolvedImport pylint: disable=import-outside-toplevel
+    return nss_lookup(grp.getgrnam, name)
+
 
 def parse_uid(v) -> int:
     if v:
+        #fast path for the common case of numeric values:
+        if isinstance(v, int):
+            return v
+        if isinstance(v, str) and v.isdecimal():
+            return int(v)
         try:
             return int(v)
         except (TypeError, ValueError):
             log("uid '%s' is not an int", v)
     if POSIX:
         try:
-            import pwd  #pylint: disable=import-outside-toplevel
-            return pwd.getpwnam(v or DEFAULT_UID).pw_uid
+            return getpwnam(v or DEFAULT_UID).pw_uid
         except Exception as e:
             log("parse_uid(%s)", v, exc_info=True)
             log.error("Error: cannot find uid of '%s': %s", v, e)
@@ -42,14 +109,18 @@ def parse_uid(v) -> int:
 
 def parse_gid(v) -> int:
     if v:
+        #fast path for the common case of numeric values:
+        if isinstance(v, int):
+            return v
+        if isinstance(v, str) and v.isdecimal():
+            return int(v)
         try:
             return int(v)
         except (TypeError, ValueError):
             log("gid '%s' is not an int", v)
     if POSIX:
         try:
-            import grp          #@UnresolvedImport pylint: disable=import-outside-toplevel
-            return grp.getgrnam(v or DEFAULT_GID).gr_gid
+            return getgrnam(v or DEFAULT_GID).gr_gid
         except Exception as e:
             log("parse_gid(%s)", v, exc_info=True)
             log.error("Error: cannot find gid of '%s': %s", v, e)
@@ -58,7 +129,7 @@ def parse_gid(v) -> int:
 
 
 class SysAuthenticatorBase:
-    USED_SALT = deque(maxlen=USED_SALT_CACHE_SIZE)
+    USED_SALT = SaltCache(USED_SALT_CACHE_SIZE)
     DEFAULT_PROMPT = "password for user '{username}'"
     CLIENT_USERNAME = False
 
@@ -162,8 +233,9 @@ class SysAuthenticatorBase:
             return False
         salt = self.get_response_salt(client_salt)
         password = gendigest("xor", challenge_response, salt)
-        log("authenticate_check(%s, %s) response salt=%s",
-            obsc(repr(challenge_response)), repr(client_salt), repr(salt))
+        if log.is_debug_enabled():
+            log("authenticate_check(%s, %s) response salt=%s",
+                obsc(repr(challenge_response)), repr(client_salt), repr(salt))
         #warning: enabling logging here would log the actual system password!
         #log.info("authenticate(%s, %s) password=%s (%s)",
         #    hexstr(challenge_response), hexstr(client_salt), password, hexstr(password))
@@ -190,7 +262,13 @@ class SysAuthenticatorBase:
             log.warn(" no password defined for '%s'", self.username)
             return False
         log("found %i passwords using %r", len(passwords), self)
+        #the password is the hmac key, so nothing can be shared between candidates,
+        #but we can avoid hashing the same one more than once:
+        checked = set()
         for x in passwords:
+            if x in checked:
+                continue
+            checked.add(x)
             if verify_digest(self.digest, x, salt, challenge_response):
                 self.password_used = x
                 return True
@@ -228,8 +306,7 @@ class SysAuthenticator(SysAuthenticatorBase):
         self.pw = None
         if POSIX:
             try:
-                import pwd  #pylint: disable=import-outside-toplevel
-                self.pw = pwd.getpwnam(self.username)
+                self.pw = getpwnam(self.username)
             except Exception:
                 log("cannot load password database entry for '%s'", self.username, exc_info=True)
 
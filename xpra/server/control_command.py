@@ -112,6 +112,7 @@ class HelpCommand(ArgsControlCommand):
 
 
 class DebugControl(ArgsControlCommand):
+    __slots__ = ()
     def __init__(self):
         super().__init__("debug",
                          "usage: 'debug enable category', 'debug disable category', 'debug status' or 'debug mark'",
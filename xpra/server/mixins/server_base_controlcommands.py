@@ -5,15 +5,18 @@
 # later version. See the file COPYING for details.
 #pylint: disable-msg=E1101
 
+import re
 import os.path
 from time import monotonic
 
 from xpra.util import parse_scaling_value, csv, from0to100, net_utf8, typedict
-from xpra.os_util import load_binary_file
 from xpra.simple_stats import std_unit
 from xpra.scripts.config import parse_bool, FALSE_OPTIONS, TRUE_OPTIONS
+from xpra.net.compression import get_enabled_compressors
+from xpra.net.packet_encoding import get_enabled_encoders
 from xpra.server.control_command import ArgsControlCommand, ControlError
 from xpra.server.mixins.stub_server_mixin import StubServerMixin
+from xpra.server.window import filters
 from xpra.log import Logger
 
 log = Logger("command")
@@ -22,6 +25,128 @@ TOGGLE_FEATURES = (
     "bell", "randr", "cursors", "notifications", "dbus-proxy", "clipboard",
     "start-new-commands", "client-shutdown", "webcam",
     )
+#ie: "dbus-proxy" -> "dbus_proxy"
+TOGGLE_FEATURE_ATTRS = {feature : feature.replace("-", "_") for feature in TOGGLE_FEATURES}
+
+#ie: "(0,10,100,20)"
+FOUR_INTS_RE = re.compile(r"\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\)")
+#ie: "0,10,100,20"
+GEOMETRY_RE = re.compile(r"(\d+),(\d+),(\d+),(\d+)\Z")
+
+#values of the 'key' command's press argument:
+KEY_PRESS_VALUES = {
+    True        : True,
+    "1"         : True,
+    "press"     : True,
+    "0"         : False,
+    "unpress"   : False,
+    }
+
+#clipboard direction -> (can_send, can_receive)
+CLIPBOARD_DIRECTIONS = {
+    "to-server" : (True, False),
+    "to-client" : (False, True),
+    "both"      : (True, True),
+    "disabled"  : (False, False),
+    }
+
+
+#lowercase string forms of the boolean options:
+TRUE_VALUES = frozenset(str(x).lower() for x in TRUE_OPTIONS)
+FALSE_VALUES = frozenset(str(x).lower() for x in FALSE_OPTIONS)
+
+def parse_boolean_value(v):
+    if isinstance(v, bool):
+        return v
+    s = v.lower() if isinstance(v, str) else str(v).lower()
+    if s in TRUE_VALUES:
+        return True
+    if s in FALSE_VALUES:
+        return False
+    raise ControlError("a boolean is required, not %s" % v)
+
+def parse_4intlist(v):
+    if not v:
+        return []
+    #ie: v = " (0,10,100,20), (200,300,20,20)"
+    #only commas and whitespace are allowed between the tuples:
+    if FOUR_INTS_RE.sub("", v).strip(", \t"):
+        raise ValueError("invalid list of 4 integers: %r" % v)
+    return [[int(x) for x in match] for match in FOUR_INTS_RE.findall(v)]
+
+
+#name, help and arguments for each ArgsControlCommand,
+#only the bound method needs to be resolved for each server instance:
+CONTROL_COMMANDS = (
+    ("focus",                 "give focus to the window id",      dict(validation=[int])),
+    ("map",                   "maps the window id",               dict(validation=[int])),
+    ("unmap",                 "unmaps the window id",             dict(validation=[int])),
+    #window source:
+    ("suspend",               "suspend screen updates",           dict(max_args=0)),
+    ("resume",                "resume screen updates",            dict(max_args=0)),
+    ("ungrab",                "cancels any grabs",                dict(max_args=0)),
+    #server globals:
+    ("readonly",              "set readonly state for client(s)", dict(min_args=1, max_args=1, validation=[parse_boolean_value])),
+    ("idle-timeout",          "set the idle tiemout",             dict(validation=[int])),
+    ("server-idle-timeout",   "set the server idle timeout",      dict(validation=[int])),
+    ("start-env",             "modify the environment used to start new commands", dict(min_args=2)),
+    ("start",                 "executes the command arguments in the server context", dict(min_args=1)),
+    ("start-child",           "executes the command arguments in the server context, as a 'child' (honouring exit-with-children)", dict(min_args=1)),
+    ("toggle-feature",        "toggle a server feature on or off, one of: %s" % csv(TOGGLE_FEATURES), dict(min_args=1, max_args=2, validation=[str, parse_boolean_value])),
+    #network and transfers:
+    ("print",                 "sends the file to the client(s) for printing", dict(min_args=1)),
+    ("open-url",              "open the URL on the client(s)",    dict(min_args=1, max_args=2)),
+    ("send-file",             "sends the file to the client(s)",  dict(min_args=1, max_args=4)),
+    ("send-notification",     "sends a notification to the client(s)",  dict(min_args=4, max_args=5, validation=[int])),
+    ("close-notification",    "send the request to close an existing notification to the client(s)", dict(min_args=1, max_args=2, validation=[int])),
+    ("compression",           "sets the packet compressor",       dict(min_args=1, max_args=1)),
+    ("encoder",               "sets the packet encoder",          dict(min_args=1, max_args=1)),
+    ("clipboard-direction",   "restrict clipboard transfers",     dict(min_args=1, max_args=1)),
+    ("clipboard-limits",      "restrict clipboard transfers size", dict(min_args=2, max_args=2, validation=[int, int])),
+    ("set-lock",              "modify the lock attribute",        dict(min_args=1, max_args=1)),
+    ("set-sharing",           "modify the sharing attribute",     dict(min_args=1, max_args=1)),
+    ("set-ui-driver",         "set the client connection driving the session", dict(min_args=1, max_args=1)),
+    #session and clients:
+    ("client",                "forwards a control command to the client(s)", dict(min_args=1)),
+    ("client-property",       "set a client property",            dict(min_args=4, max_args=5, validation=[int])),
+    ("name",                  "set the session name",             dict(min_args=1, max_args=1)),
+    ("key",                   "press or unpress a key",           dict(min_args=1, max_args=2)),
+    ("sound-output",          "control sound forwarding",         dict(min_args=1, max_args=2)),
+    #windows:
+    ("workspace",             "move a window to a different workspace", dict(min_args=2, max_args=2, validation=[int, int])),
+    ("close",                 "close a window",                   dict(min_args=1, max_args=1, validation=[int])),
+    ("delete",                "delete a window",                   dict(min_args=1, max_args=1, validation=[int])),
+    ("move",                  "move a window",                    dict(min_args=3, max_args=3, validation=[int, int, int])),
+    ("resize",                "resize a window",                  dict(min_args=3, max_args=3, validation=[int, int, int])),
+    ("moveresize",            "move and resize a window",         dict(min_args=5, max_args=5, validation=[int, int, int, int, int])),
+    ("scaling-control",       "set the scaling-control aggressiveness (from 0 to 100)", dict(min_args=1, validation=[from0to100])),
+    ("scaling",               "set a specific scaling value",     dict(min_args=1, validation=[parse_scaling_value])),
+    ("auto-refresh",          "set a specific auto-refresh value", dict(min_args=1, validation=[float])),
+    ("refresh",               "refresh some or all windows",      dict(min_args=0)),
+    ("encoding",              "picture encoding",                 dict(min_args=2)),
+    ("request-update",        "request a screen update using a specific encoding",  dict(min_args=3)),
+    ("video-region-enabled",  "enable video region",              dict(min_args=2, max_args=2, validation=[int, parse_boolean_value])),
+    ("video-region-detection","enable video detection",           dict(min_args=2, max_args=2, validation=[int, parse_boolean_value])),
+    ("video-region-exclusion-zones","set window regions to exclude from video regions: 'WID,(x,y,w,h),(x,y,w,h),..', ie: '1 (0,10,100,20),(200,300,20,20)'",  dict(min_args=2, max_args=2, validation=[int, parse_4intlist])),
+    ("video-region",          "set the video region",             dict(min_args=5, max_args=5, validation=[int, int, int, int, int])),
+    ("reset-video-region",    "reset video region heuristics",    dict(min_args=1, max_args=1, validation=[int])),
+    ("lock-batch-delay",      "set a specific batch delay for a window",       dict(min_args=2, max_args=2, validation=[int, int])),
+    ("unlock-batch-delay",    "let the heuristics calculate the batch delay again for a window (following a 'lock-batch-delay')",  dict(min_args=1, max_args=1, validation=[int])),
+    ("remove-window-filters", "remove all window filters",        dict(min_args=0, max_args=0)),
+    ("add-window-filter",     "add a window filter",              dict(min_args=4, max_args=5)),
+    )
+
+ENCODING_PROPERTIES = (
+    "quality", "min-quality", "max-quality",
+    "speed", "min-speed", "max-speed",
+    )
+#ie: "min-quality" -> "set_min_quality"
+ENCODING_SETTERS = {name : "set_%s" % name.replace("-", "_") for name in ENCODING_PROPERTIES}
+#ie: "idle-timeout" -> "control_command_idle_timeout"
+COMMAND_METHODS = {
+    name : "control_command_%s" % name.replace("-", "_")
+    for name in tuple(spec[0] for spec in CONTROL_COMMANDS)+ENCODING_PROPERTIES
+    }
 
 
 class ServerBaseControlCommands(StubServerMixin):
@@ -34,112 +159,45 @@ class ServerBaseControlCommands(StubServerMixin):
 
 
     def add_control_commands(self):
-        def parse_boolean_value(v):
-            if str(v).lower() in TRUE_OPTIONS:
-                return True
-            if str(v).lower() in FALSE_OPTIONS:
-                return False
-            raise ControlError("a boolean is required, not %s" % v)
-        def parse_4intlist(v):
-            if not v:
-                return []
-            l = []
-            #ie: v = " (0,10,100,20), (200,300,20,20)"
-            while v:
-                v = v.strip().strip(",").strip()    #ie: "(0,10,100,20)"
-                lp = v.find("(")
-                assert lp==0, "invalid leading characters: %s" % v[:lp]
-                rp = v.find(")")
-                assert (lp+1)<rp
-                item = v[lp+1:rp].strip()           #"0,10,100,20"
-                items = [int(x) for x in item]      # 0,10,100,20
-                assert len(items)==4, "expected 4 numbers but got %i" % len(items)
-                l.append(items)
-            return l
-
-        for cmd in (
-            ArgsControlCommand("focus",                 "give focus to the window id",      validation=[int]),
-            ArgsControlCommand("map",                   "maps the window id",               validation=[int]),
-            ArgsControlCommand("unmap",                 "unmaps the window id",             validation=[int]),
-            #window source:
-            ArgsControlCommand("suspend",               "suspend screen updates",           max_args=0),
-            ArgsControlCommand("resume",                "resume screen updates",            max_args=0),
-            ArgsControlCommand("ungrab",                "cancels any grabs",                max_args=0),
-            #server globals:
-            ArgsControlCommand("readonly",              "set readonly state for client(s)", min_args=1, max_args=1, validation=[parse_boolean_value]),
-            ArgsControlCommand("idle-timeout",          "set the idle tiemout",             validation=[int]),
-            ArgsControlCommand("server-idle-timeout",   "set the server idle timeout",      validation=[int]),
-            ArgsControlCommand("start-env",             "modify the environment used to start new commands", min_args=2),
-            ArgsControlCommand("start",                 "executes the command arguments in the server context", min_args=1),
-            ArgsControlCommand("start-child",           "executes the command arguments in the server context, as a 'child' (honouring exit-with-children)", min_args=1),
-            ArgsControlCommand("toggle-feature",        "toggle a server feature on or off, one of: %s" % csv(TOGGLE_FEATURES), min_args=1, max_args=2, validation=[str, parse_boolean_value]),
-            #network and transfers:
-            ArgsControlCommand("print",                 "sends the file to the client(s) for printing", min_args=1),
-            ArgsControlCommand("open-url",              "open the URL on the client(s)",    min_args=1, max_args=2),
-            ArgsControlCommand("send-file",             "sends the file to the client(s)",  min_args=1, max_args=4),
-            ArgsControlCommand("send-notification",     "sends a notification to the client(s)",  min_args=4, max_args=5, validation=[int]),
-            ArgsControlCommand("close-notification",    "send the request to close an existing notification to the client(s)", min_args=1, max_args=2, validation=[int]),
-            ArgsControlCommand("compression",           "sets the packet compressor",       min_args=1, max_args=1),
-            ArgsControlCommand("encoder",               "sets the packet encoder",          min_args=1, max_args=1),
-            ArgsControlCommand("clipboard-direction",   "restrict clipboard transfers",     min_args=1, max_args=1),
-            ArgsControlCommand("clipboard-limits",      "restrict clipboard transfers size", min_args=2, max_args=2, validation=[int, int]),
-            ArgsControlCommand("set-lock",              "modify the lock attribute",        min_args=1, max_args=1),
-            ArgsControlCommand("set-sharing",           "modify the sharing attribute",     min_args=1, max_args=1),
-            ArgsControlCommand("set-ui-driver",         "set the client connection driving the session", min_args=1, max_args=1),
-            #session and clients:
-            ArgsControlCommand("client",                "forwards a control command to the client(s)", min_args=1),
-            ArgsControlCommand("client-property",       "set a client property",            min_args=4, max_args=5, validation=[int]),
-            ArgsControlCommand("name",                  "set the session name",             min_args=1, max_args=1),
-            ArgsControlCommand("key",                   "press or unpress a key",           min_args=1, max_args=2),
-            ArgsControlCommand("sound-output",          "control sound forwarding",         min_args=1, max_args=2),
-            #windows:
-            ArgsControlCommand("workspace",             "move a window to a different workspace", min_args=2, max_args=2, validation=[int, int]),
-            ArgsControlCommand("close",                 "close a window",                   min_args=1, max_args=1, validation=[int]),
-            ArgsControlCommand("delete",                "delete a window",                   min_args=1, max_args=1, validation=[int]),
-            ArgsControlCommand("move",                  "move a window",                    min_args=3, max_args=3, validation=[int, int, int]),
-            ArgsControlCommand("resize",                "resize a window",                  min_args=3, max_args=3, validation=[int, int, int]),
-            ArgsControlCommand("moveresize",            "move and resize a window",         min_args=5, max_args=5, validation=[int, int, int, int, int]),
-            ArgsControlCommand("scaling-control",       "set the scaling-control aggressiveness (from 0 to 100)", min_args=1, validation=[from0to100]),
-            ArgsControlCommand("scaling",               "set a specific scaling value",     min_args=1, validation=[parse_scaling_value]),
-            ArgsControlCommand("auto-refresh",          "set a specific auto-refresh value", min_args=1, validation=[float]),
-            ArgsControlCommand("refresh",               "refresh some or all windows",      min_args=0),
-            ArgsControlCommand("encoding",              "picture encoding",                 min_args=2),
-            ArgsControlCommand("request-update",        "request a screen update using a specific encoding",  min_args=3),
-            ArgsControlCommand("video-region-enabled",  "enable video region",              min_args=2, max_args=2, validation=[int, parse_boolean_value]),
-            ArgsControlCommand("video-region-detection","enable video detection",           min_args=2, max_args=2, validation=[int, parse_boolean_value]),
-            ArgsControlCommand("video-region-exclusion-zones","set window regions to exclude from video regions: 'WID,(x,y,w,h),(x,y,w,h),..', ie: '1 (0,10,100,20),(200,300,20,20)'",  min_args=2, max_args=2, validation=[int, parse_4intlist]),
-            ArgsControlCommand("video-region",          "set the video region",             min_args=5, max_args=5, validation=[int, int, int, int, int]),
-            ArgsControlCommand("reset-video-region",    "reset video region heuristics",    min_args=1, max_args=1, validation=[int]),
-            ArgsControlCommand("lock-batch-delay",      "set a specific batch delay for a window",       min_args=2, max_args=2, validation=[int, int]),
-            ArgsControlCommand("unlock-batch-delay",    "let the heuristics calculate the batch delay again for a window (following a 'lock-batch-delay')",  min_args=1, max_args=1, validation=[int]),
-            ArgsControlCommand("remove-window-filters", "remove all window filters",        min_args=0, max_args=0),
-            ArgsControlCommand("add-window-filter",     "add a window filter",              min_args=4, max_args=5),
-            ):
-            cmd.do_run = getattr(self, "control_command_%s" % cmd.name.replace("-", "_"))
-            self.control_commands[cmd.name] = cmd
+        for name, help_text, kwargs in CONTROL_COMMANDS:
+            run = getattr(self, COMMAND_METHODS[name])
+            self.control_commands[name] = ArgsControlCommand(name, help_text, run=run, **kwargs)
         #encoding bits:
-        for name in (
-            "quality", "min-quality", "max-quality",
-            "speed", "min-speed", "max-speed",
-            ):
-            fn = getattr(self, "control_command_%s" % name.replace("-", "_"))
+        for name in ENCODING_PROPERTIES:
+            fn = getattr(self, COMMAND_METHODS[name])
             self.control_commands[name] = ArgsControlCommand(name, "set encoding %s (from 0 to 100)" % name, run=fn, min_args=1, validation=[from0to100])
 
 
+    def _sources_snapshot(self):
+        #connections can be removed while we iterate over them:
+        return tuple(self._server_sources.values())
+
+    def _source_methods(self, name):
+        #the bound methods of the connections that support this feature:
+        methods = []
+        for source in self._sources_snapshot():
+            method = getattr(source, name, None)
+            if method:
+                methods.append(method)
+        return methods
+
+
     #########################################
     # Control Commands
     #########################################
     def control_command_focus(self, wid):
         if self.readonly:
             return
-        assert type(wid)==int, "argument should have been an int, but found %s" % type(wid)
+        if not isinstance(wid, int):
+            raise ControlError("argument should have been an int, but found %s" % type(wid))
         self._focus(None, wid, None)
         return "gave focus to window %s" % wid
 
     def control_command_map(self, wid):
         if self.readonly:
             return
-        assert type(wid)==int, "argument should have been an int, but found %s" % type(wid)
+        if not isinstance(wid, int):
+            raise ControlError("argument should have been an int, but found %s" % type(wid))
         window = self._id_to_window.get(wid)
         assert window, "window %i not found" % wid
         if window.is_tray():
@@ -159,7 +217,8 @@ class ServerBaseControlCommands(StubServerMixin):
     def control_command_unmap(self, wid):
         if self.readonly:
             return
-        assert type(wid)==int, "argument should have been an int, but found %s" % type(wid)
+        if not isinstance(wid, int):
+            raise ControlError("argument should have been an int, but found %s" % type(wid))
         window = self._id_to_window.get(wid)
         assert window, "window %i not found" % wid
         if window.is_tray():
@@ -171,19 +230,22 @@ class ServerBaseControlCommands(StubServerMixin):
         return "unmapped window %s" % wid
 
     def control_command_suspend(self):
-        for csource in tuple(self._server_sources.values()):
+        sources = self._sources_snapshot()
+        for csource in sources:
             csource.suspend(True, self._id_to_window)
-        return "suspended %s clients" % len(self._server_sources)
+        return "suspended %s clients" % len(sources)
 
     def control_command_resume(self):
-        for csource in tuple(self._server_sources.values()):
+        sources = self._sources_snapshot()
+        for csource in sources:
             csource.resume(True, self._id_to_window)
-        return "resumed %s clients" % len(self._server_sources)
+        return "resumed %s clients" % len(sources)
 
     def control_command_ungrab(self):
-        for csource in tuple(self._server_sources.values()):
+        sources = self._sources_snapshot()
+        for csource in sources:
             csource.pointer_ungrab(-1)
-        return "ungrabbed %s clients" % len(self._server_sources)
+        return "ungrabbed %s clients" % len(sources)
 
     def control_command_readonly(self, onoff):
         log("control_command_readonly(%s)", onoff)
@@ -194,7 +256,7 @@ class ServerBaseControlCommands(StubServerMixin):
 
     def control_command_idle_timeout(self, t):
         self.idle_timeout = t
-        for csource in tuple(self._server_sources.values()):
+        for csource in self._sources_snapshot():
             csource.idle_timeout = t
             csource.schedule_idle_timeout()
         return "idle-timeout set to %s" % t
@@ -234,16 +296,16 @@ class ServerBaseControlCommands(StubServerMixin):
 
     def control_command_toggle_feature(self, feature, state=None):
         log("control_command_toggle_feature(%s, %s)", feature, state)
-        if feature not in TOGGLE_FEATURES:
+        fn = TOGGLE_FEATURE_ATTRS.get(feature)
+        if not fn:
             msg = "invalid feature '%s'" % feature
             log.warn(msg)
             return msg
-        fn = feature.replace("-", "_")
-        if not hasattr(self, feature):
-            msg = "attribute '%s' not found - bug?" % feature
+        if not hasattr(self, fn):
+            msg = "attribute '%s' not found - bug?" % fn
             log.warn(msg)
             return msg
-        cur = getattr(self, fn, None)
+        cur = getattr(self, fn)
         if state is None:
             #if the new state is not specified, just negate the value
             state = not cur
@@ -254,20 +316,21 @@ class ServerBaseControlCommands(StubServerMixin):
     def _control_get_sources(self, client_uuids_str, _attr=None):
         #find the client uuid specified as a string:
         if client_uuids_str=="UI":
-            sources = [ss for ss in self._server_sources.values() if ss.ui_client]
-            client_uuids = [ss.uuid for ss in sources]
-            notfound = ()
-        elif client_uuids_str=="*":
-            sources = self._server_sources.values()
-            client_uuids = [ss.uuid for ss in sources]
-        else:
-            client_uuids = client_uuids_str.split(",")
-            sources = [ss for ss in self._server_sources.values() if ss.uuid in client_uuids]
-            uuids = tuple(ss.uuid for ss in sources)
-            notfound = any(x for x in client_uuids if x not in uuids)
-            if notfound:
-                log.warn("client connection not found for uuid(s): %s", notfound)
-        return sources
+            return tuple(ss for ss in self._server_sources.values() if ss.ui_client)
+        if client_uuids_str=="*":
+            return self._sources_snapshot()
+        by_uuid = {ss.uuid : ss for ss in self._server_sources.values()}
+        sources = []
+        notfound = []
+        for uuid in dict.fromkeys(client_uuids_str.split(",")):
+            ss = by_uuid.get(uuid)
+            if ss is None:
+                notfound.append(uuid)
+            else:
+                sources.append(ss)
+        if notfound:
+            log.warn("client connection not found for uuid(s): %s", csv(notfound))
+        return tuple(sources)
 
     def control_command_send_notification(self, nid, title, message, client_uuids):
         if not self.notifications:
@@ -324,9 +387,9 @@ class ServerBaseControlCommands(StubServerMixin):
         #parse options into a dict:
         options = {}
         for arg in options_strs:
-            argp = arg.split("=", 1)
-            if len(argp)==2 and len(argp[0])>0:
-                options[argp[0]] = argp[1]
+            i = arg.find("=")
+            if i>0:
+                options[arg[:i]] = arg[i+1:]
         return self.do_control_file_command("print", client_uuids, filename, "printing", (True, True, options))
 
     def do_control_file_command(self, command_type, client_uuids, filename, source_flag_name, send_file_args):
@@ -342,18 +405,26 @@ class ServerBaseControlCommands(StubServerMixin):
         #find the file and load it:
         actual_filename = os.path.abspath(os.path.expanduser(filename))
         try:
-            stat = os.stat(actual_filename)
-            log("os.stat(%s)=%s", actual_filename, stat)
-        except os.error:
-            log("os.stat(%s)", actual_filename, exc_info=True)
-        else:
-            checksize(stat.st_size)
-        if not os.path.exists(actual_filename):
-            raise ControlError("file '%s' does not exist" % filename)
-        data = load_binary_file(actual_filename)
-        if data is None:
-            raise ControlError("failed to load '%s'" % actual_filename)
-        #verify size:
+            fd = os.open(actual_filename, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        except FileNotFoundError:
+            raise ControlError("file '%s' does not exist" % filename) from None
+        except OSError as e:
+            log("os.open(%s)", actual_filename, exc_info=True)
+            raise ControlError("failed to open '%s': %s" % (actual_filename, e)) from None
+        #read a snapshot of the file:
+        #the data is sent in chunks long after this command returns,
+        #and must match the checksum computed when the transfer starts
+        with os.fdopen(fd, "rb") as f:
+            file_size = os.fstat(fd).st_size
+            log("os.fstat(%s)=%s", actual_filename, file_size)
+            checksize(file_size)
+            try:
+                data = f.read()
+            except OSError as e:
+                log("read(%s)", actual_filename, exc_info=True)
+                raise ControlError("failed to load '%s': %s" % (actual_filename, e)) from None
+        #verify size,
+        #some files (ie: procfs) don't report their real size:
         file_size = len(data)
         checksize(file_size)
         #send it to each client:
@@ -362,16 +433,19 @@ class ServerBaseControlCommands(StubServerMixin):
             if not getattr(ss, source_flag_name, False):
                 #skip the warning if the client is not interactive
                 #(for now just check for 'top' client):
-                if ss.client_type=="top":
+                client_type = ss.client_type
+                if client_type=="top":
                     l = log
                 else:
                     l = log.warn
-                l("Warning: cannot %s '%s' to %s client", command_type, filename, ss.client_type)
+                l("Warning: cannot %s '%s' to %s client", command_type, filename, client_type)
                 l(" client %s does not support this feature", ss.uuid)
-            elif file_size>ss.file_size_limit:
+                continue
+            limit = ss.file_size_limit
+            if file_size>limit:
                 log.warn("Warning: cannot %s '%s'", command_type, filename)
                 log.warn(" client %s file size limit is %sB (file is %sB)",
-                         ss, std_unit(ss.file_size_limit), std_unit(file_size))
+                         ss, std_unit(limit), std_unit(file_size))
             else:
                 ss.send_file(filename, "", data, file_size, *send_file_args)
         return "%s of '%s' to %s initiated" % (command_type, filename, client_uuids)
@@ -385,7 +459,7 @@ class ServerBaseControlCommands(StubServerMixin):
         return "removed %i window-filters" % l
 
     def control_command_add_window_filter(self, object_name, property_name, operator, value, client_uuids=""):
-        from xpra.server.window import filters  #pylint: disable=import-outside-toplevel
+        #use the module attribute since the x11 server replaces get_window_filter:
         window_filter = filters.get_window_filter(object_name, property_name, operator, value)
         #log("%s%s=%s", filters.get_window_filter, (object_name, property_name, operator, value), window_filter)
         if client_uuids=="*":
@@ -397,21 +471,19 @@ class ServerBaseControlCommands(StubServerMixin):
         return "added window-filter: %s for client uuids=%s" % (window_filter, client_uuids)
 
 
-    def control_command_compression(self, compression):
-        c = compression.lower()
-        from xpra.net import compression    #pylint: disable=import-outside-toplevel
-        opts = compression.get_enabled_compressors()    #ie: [lz4, zlib]
+    def control_command_compression(self, compressor):
+        c = compressor.lower()
+        opts = get_enabled_compressors()    #ie: [lz4, zlib]
         if c not in opts:
             raise ControlError("compressor argument must be one of: %s" % csv(opts))
         for cproto in tuple(self._server_sources.keys()):
             cproto.enable_compressor(c)
         self.all_send_client_command("enable_%s" % c)
-        return "compressors set to %s" % compression
+        return "compressors set to %s" % compressor
 
     def control_command_encoder(self, encoder):
         e = encoder.lower()
-        from xpra.net import packet_encoding  #pylint: disable=import-outside-toplevel
-        opts = packet_encoding.get_enabled_encoders()   #ie: [rencode, rencodeplus, bencode, yaml]
+        opts = get_enabled_encoders()   #ie: [rencode, rencodeplus, bencode, yaml]
         if e not in opts:
             raise ControlError("encoder argument must be one of: %s" % csv(opts))
         for cproto in tuple(self._server_sources.keys()):
@@ -422,7 +494,7 @@ class ServerBaseControlCommands(StubServerMixin):
 
     def all_send_client_command(self, *client_command):
         """ forwards the command to all clients """
-        for source in tuple(self._server_sources.values()):
+        for source in self._sources_snapshot():
             # forwards to *the* client, if there is *one*
             if client_command[0] not in source.control_commands:
                 log.info("client command '%s' not forwarded to client %s (not supported)", client_command, source)
@@ -454,39 +526,49 @@ class ServerBaseControlCommands(StubServerMixin):
         self.mdns_update()
         return "session name set to %s" % name
 
-    def _ws_from_args(self, *args):
-        #converts the args to valid window ids,
-        #then returns all the window sources for those wids
+    def _wids_from_args(self, *args):
+        #converts the args to a set of valid window ids
         if len(args)==0 or len(args)==1 and args[0]=="*":
             #default to all if unspecified:
-            wids = tuple(self._id_to_window.keys())
+            wids = set(self._id_to_window.keys())
         else:
-            wids = []
+            wids = set()
             for x in args:
                 try:
                     wid = int(x)
                 except ValueError:
                     raise ControlError("invalid window id: %s" % x) from None
                 if wid in self._id_to_window:
-                    wids.append(wid)
+                    wids.add(wid)
                 else:
                     log("window id %s does not exist", wid)
+        return wids
+
+    def _ws_from_args(self, *args):
+        #returns all the window sources for the window ids given
+        wids = self._wids_from_args(*args)
+        #all the wids are valid windows by now,
+        #so we only need the ones that each source also knows about:
         wss = []
-        for csource in tuple(self._server_sources.values()):
-            for wid in wids:
-                ws = csource.window_sources.get(wid)
-                window = self._id_to_window.get(wid)
-                if window and ws:
+        for csource in self._sources_snapshot():
+            ws_map = csource.window_sources
+            for wid in ws_map.keys() & wids:
+                ws = ws_map.get(wid)
+                if ws:
                     wss.append(ws)
         return wss
 
 
     def _set_encoding_property(self, name, value, *wids):
-        for ws in self._ws_from_args(*wids):
-            fn = getattr(ws, "set_%s" % name.replace("-", "_"))   #ie: "set_quality"
-            fn(value)
-        #now also update the defaults:
-        for csource in tuple(self._server_sources.values()):
+        wids = self._wids_from_args(*wids)
+        setter = ENCODING_SETTERS[name]
+        for csource in self._sources_snapshot():
+            ws_map = csource.window_sources
+            for wid in ws_map.keys() & wids:
+                ws = ws_map.get(wid)
+                if ws:
+                    getattr(ws, setter)(value)
+            #also update the defaults:
             csource.default_encoding_options[name] = value
         return "%s set to %i" % (name, value)
 
@@ -533,21 +615,21 @@ class ServerBaseControlCommands(StubServerMixin):
             encoding = args[0]
             wids = args[1:]
             for ws in tuple(self._ws_from_args(*wids)):
-                encodings = list(ws.encodings)
-                core_encodings = list(ws.core_encodings)
-                for l in (encodings, core_encodings):
-                    if cmd=="add" and encoding not in l:
-                        log("adding %s to %s for %s", encoding, l, ws)
-                        l.append(encoding)
-                    elif cmd=="remove" and encoding in l:
-                        log("removing %s from %s for %s", encoding, l, ws)
-                        l.remove(encoding)
-                    else:
-                        continue
-                ws.encodings = tuple(encodings)
-                ws.core_encodings = tuple(core_encodings)
-                ws.do_set_client_properties(typedict())
-                ws.refresh()
+                changed = False
+                for attr in ("encodings", "core_encodings"):
+                    cur = tuple(getattr(ws, attr))
+                    if cmd=="add" and encoding not in cur:
+                        log("adding %s to %s for %s", encoding, cur, ws)
+                        setattr(ws, attr, cur+(encoding,))
+                        changed = True
+                    elif cmd=="remove" and encoding in cur:
+                        log("removing %s from %s for %s", encoding, cur, ws)
+                        setattr(ws, attr, tuple(x for x in cur if x!=encoding))
+                        changed = True
+                #no need to update anything if the encodings are unchanged:
+                if changed:
+                    ws.do_set_client_properties(typedict())
+                    ws.refresh()
             return "%s %s" % (["removed", "added"][cmd=="add"], encoding)
 
         strict = None       #means no change
@@ -573,14 +655,21 @@ class ServerBaseControlCommands(StubServerMixin):
             "auto_refresh" : True,
             "av-delay" : 0,
             }
+        geometry = None
+        if geom!="all":
+            m = GEOMETRY_RE.match(geom)
+            if not m:
+                raise ControlError("invalid geometry %r, must be 'all' or 'x,y,w,h'" % geom)
+            geometry = tuple(int(v) for v in m.groups())
+        wss = self._ws_from_args(*wids)
         log("request-update using %r, geometry=%s, windows(%s)=%s",
-                 encoding, geom, wids, self._ws_from_args(*wids))
-        for ws in tuple(self._ws_from_args(*wids)):
-            if geom=="all":
+                 encoding, geom, wids, wss)
+        for ws in wss:
+            if geometry:
+                x, y, w, h = geometry
+            else:
                 x = y = 0
                 w, h = ws.window_dimensions
-            else:
-                x, y, w, h = (int(x) for x in geom.split(","))
             ws.process_damage_region(now, x, y, w, h, encoding, options)
         return "damage requested"
 
@@ -588,11 +677,11 @@ class ServerBaseControlCommands(StubServerMixin):
         ch = self._clipboard_helper
         assert self.clipboard and ch
         direction = direction.lower()
-        DIRECTIONS = ("to-server", "to-client", "both", "disabled")
-        assert direction in DIRECTIONS, "invalid direction '%s', must be one of %s" % (direction, csv(DIRECTIONS))
+        caps = CLIPBOARD_DIRECTIONS.get(direction)
+        if caps is None:
+            raise ControlError("invalid direction '%s', must be one of %s" % (direction, csv(CLIPBOARD_DIRECTIONS)))
         self.clipboard_direction = direction
-        can_send = direction in ("to-server", "both")
-        can_receive = direction in ("to-client", "both")
+        can_send, can_receive = caps
         ch.set_direction(can_send, can_receive)
         msg = "clipboard direction set to '%s'" % direction
         log(msg)
@@ -611,26 +700,24 @@ class ServerBaseControlCommands(StubServerMixin):
     def _control_video_subregions_from_wid(self, wid):
         if wid not in self._id_to_window:
             raise ControlError("invalid window %i" % wid)
-        video_subregions = []
+        #generator: the callers only iterate over the video subregions once
         for ws in self._ws_from_args(wid):
             vs = getattr(ws, "video_subregion", None)
             if not vs:
                 log.warn("Warning: cannot set video region enabled flag on window %i:", wid)
                 log.warn(" no video subregion attribute found in %s", type(ws))
                 continue
-            video_subregions.append(vs)
-        #log("_control_video_subregions_from_wid(%s)=%s", wid, video_subregions)
-        return video_subregions
+            yield vs
 
     def control_command_video_region_enabled(self, wid, enabled):
         for vs in self._control_video_subregions_from_wid(wid):
             vs.set_enabled(enabled)
-        return "video region %s for window %i" % (["disabled", "enabled"][int(enabled)], wid)
+        return "video region %s for window %i" % ("enabled" if enabled else "disabled", wid)
 
     def control_command_video_region_detection(self, wid, detection):
         for vs in self._control_video_subregions_from_wid(wid):
             vs.set_detection(detection)
-        return "video region detection %s for window %i" % (["disabled", "enabled"][int(detection)], wid)
+        return "video region detection %s for window %i" % ("enabled" if detection else "disabled", wid)
 
     def control_command_video_region(self, wid, x, y, w, h):
         for vs in self._control_video_subregions_from_wid(wid):
@@ -690,26 +777,26 @@ class ServerBaseControlCommands(StubServerMixin):
             raise ControlError("invalid keycode specified: '%s' (not a number)" % keycode_str) from None
         if keycode<=0 or keycode>=255:
             raise ControlError("invalid keycode value: '%s' (must be between 1 and 255)" % keycode_str)
-        if press is not True:
-            if press in ("1", "press"):
-                press = True
-            elif press in ("0", "unpress"):
-                press = False
-            else:
-                raise ControlError("if present, the press argument must be one of: %s" %
-                                   csv(("1", "press", "0", "unpress")))
-        self.fake_key(keycode, press)
+        pressed = KEY_PRESS_VALUES.get(press)
+        if pressed is None:
+            raise ControlError("if present, the press argument must be one of: %s" %
+                               csv(("1", "press", "0", "unpress")))
+        self.fake_key(keycode, pressed)
 
     def control_command_sound_output(self, *args):
         msg = []
-        for csource in tuple(self._server_sources.values()):
+        for csource in self._sources_snapshot():
             msg.append("%s : %s" % (csource, csource.sound_control(*args)))
         return csv(msg)
 
-    def control_command_workspace(self, wid, workspace):
+    def _require_window(self, wid):
         window = self._id_to_window.get(wid)
         if not window:
             raise ControlError("window %s does not exist" % wid)
+        return window
+
+    def control_command_workspace(self, wid, workspace):
+        window = self._require_window(wid)
         if "workspace" not in window.get_property_names():
             raise ControlError("cannot set workspace on window %s" % window)
         if workspace<0:
@@ -719,55 +806,36 @@ class ServerBaseControlCommands(StubServerMixin):
 
 
     def control_command_close(self, wid):
-        window = self._id_to_window.get(wid)
-        if not window:
-            raise ControlError("window %s does not exist" % wid)
+        window = self._require_window(wid)
         window.request_close()
         return "requested window %s closed" % window
 
     def control_command_delete(self, wid):
-        window = self._id_to_window.get(wid)
-        if not window:
-            raise ControlError("window %s does not exist" % wid)
+        window = self._require_window(wid)
         window.send_delete()
         return "requested window %s deleted" % window
 
     def control_command_move(self, wid, x, y):
-        window = self._id_to_window.get(wid)
-        if not window:
-            raise ControlError("window %s does not exist" % wid)
+        window = self._require_window(wid)
         ww, wh = window.get_dimensions()
-        count = 0
-        for source in tuple(self._server_sources.values()):
-            move_resize_window = getattr(source, "move_resize_window", None)
-            if move_resize_window:
-                move_resize_window(wid, window, x, y, ww, wh)
-                count += 1
-        return "window %s moved to %i,%i for %i clients" % (wid, x, y, count)
+        methods = self._source_methods("move_resize_window")
+        for move_resize_window in methods:
+            move_resize_window(wid, window, x, y, ww, wh)
+        return "window %s moved to %i,%i for %i clients" % (wid, x, y, len(methods))
 
     def control_command_resize(self, wid, w, h):
-        window = self._id_to_window.get(wid)
-        if not window:
-            raise ControlError("window %s does not exist" % wid)
-        count = 0
-        for source in tuple(self._server_sources.values()):
-            resize_window = getattr(source, "resize_window", None)
-            if resize_window:
-                resize_window(wid, window, w, h)
-                count += 1
-        return "window %s resized to %ix%i for %i clients" % (wid, w, h, count)
+        window = self._require_window(wid)
+        methods = self._source_methods("resize_window")
+        for resize_window in methods:
+            resize_window(wid, window, w, h)
+        return "window %s resized to %ix%i for %i clients" % (wid, w, h, len(methods))
 
     def control_command_moveresize(self, wid, x, y, w, h):
-        window = self._id_to_window.get(wid)
-        if not window:
-            raise ControlError("window %s does not exist" % wid)
-        count = 0
-        for source in tuple(self._server_sources.values()):
-            move_resize_window = getattr(source, "move_resize_window", None)
-            if move_resize_window:
-                move_resize_window(wid, window, x, y, w, h)
-                count += 1
-        return "window %s moved to %i,%i and resized to %ix%i for %i clients" % (wid, x, y, w, h, count)
+        window = self._require_window(wid)
+        methods = self._source_methods("move_resize_window")
+        for move_resize_window in methods:
+            move_resize_window(wid, window, x, y, w, h)
+        return "window %s moved to %i,%i and resized to %ix%i for %i clients" % (wid, x, y, w, h, len(methods))
 
 
     def _process_command_request(self, _proto, packet):
@@ -779,6 +847,4 @@ class ServerBaseControlCommands(StubServerMixin):
         log("command request returned: %s (%s)", code, msg)
 
     def init_packet_handlers(self):
-        self._authenticated_packet_handlers.update({
-            "command_request" : self._process_command_request,
-          })
+        self._authenticated_packet_handlers["command_request"] = self._process_command_request
@@ -726,12 +726,12 @@ class ServerCore:
         name = args[0]
         try:
             command = self.control_commands.get(name) or self.control_commands.get("*")
-            commandlog(f"process_control_command control_commands[{name}]={command}")
+            commandlog("process_control_command control_commands[%s]=%s", name, command)
             if not command:
                 commandlog.warn(f"Warning: invalid command: {name!r}")
                 commandlog.warn(f" must be one of: {csv(self.control_commands)}")
                 return 6, "invalid command"
-            commandlog(f"process_control_command calling {command.run}({args[1:]})")
+            commandlog("process_control_command calling %s%s", command.run, args[1:])
             v = command.run(*args[1:])
             return 0, v
         except ControlError as e:
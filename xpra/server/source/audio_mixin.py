@@ -8,6 +8,10 @@ import os
 
 from xpra.net.compression import Compressed
 from xpra.server.source.stub_source_mixin import StubSourceMixin
+from xpra.sound.gstreamer_util import (
+    ALLOW_SOUND_LOOP, ENCODER_LATENCY, RECORD_PIPELINE_LATENCY,
+    loop_warning_messages,
+    )
 from xpra.os_util import get_machine_id, get_user_uuid, bytestostr, POSIX
 from xpra.util import csv, envbool, envint, flatten_dict, typedict, XPRA_AUDIO_NOTIFICATION_ID
 from xpra.log import Logger
@@ -18,6 +22,62 @@ NEW_STREAM_SOUND = envbool("XPRA_NEW_STREAM_SOUND", True)
 NEW_STREAM_SOUND_STOP = envint("XPRA_NEW_STREAM_SOUND_STOP", 20)
 
 
+#class -> {action : method name},
+#ie: {ClientConnectionClass : {"av-sync-delta" : "sound_control_av_sync_delta", ..}}
+#(actions can also be specified using underscores, ie: "av_sync_delta")
+SOUND_CONTROL_METHODS = {}
+def get_sound_control_methods(cls):
+    methods = SOUND_CONTROL_METHODS.get(cls)
+    if methods is None:
+        prefix = "sound_control_"
+        methods = {}
+        for name in dir(cls):
+            if name.startswith(prefix):
+                action = name[len(prefix):]
+                methods[action] = methods[action.replace("_", "-")] = name
+        SOUND_CONTROL_METHODS[cls] = methods
+    return methods
+
+#the server's machine-id and user uuid do not change,
+#so only read them once:
+local_ids = None
+def get_local_ids():
+    global local_ids
+    if local_ids is None:
+        local_ids = get_machine_id(), get_user_uuid()
+    return local_ids
+
+#the path to the new-stream sound sample, or an empty string if it does not exist:
+bell_sample = None
+def get_bell_sample():
+    global bell_sample
+    if bell_sample is None:
+        from xpra.platform.paths import get_resources_dir
+        bell_sample = os.path.join(get_resources_dir(), "bell.wav")
+        if not os.path.exists(bell_sample):
+            log("new stream sound sample '%s' not found", bell_sample)
+            bell_sample = ""
+    return bell_sample
+
+def get_default_latency(codec):
+    #hard-coded estimate, used until the sound source reports its latency:
+    return RECORD_PIPELINE_LATENCY + ENCODER_LATENCY.get(codec, 0)
+
+
+class FakeSink:
+    """
+    Discards the sound data,
+    used when forwarding it would create an audio loop
+    """
+    __slots__ = ("codec", )
+    def __init__(self, codec):
+        self.codec = codec
+    def add_data(self, *args):
+        log("FakeSink.add_data%s ignored", args)
+    def cleanup(self, *args):
+        log("FakeSink.cleanup%s ignored", args)
+
+
 class AudioMixin(StubSourceMixin):
 
     @classmethod
@@ -45,6 +105,7 @@ class AudioMixin(StubSourceMixin):
         self.wants_sound = True
         self.sound_source_sequence = 0
         self.sound_source = None
+        self.sound_source_buffers = 0
         self.sound_sink = None
         self.pulseaudio_id = None
         self.pulseaudio_cookie_hash = None
@@ -54,7 +115,11 @@ class AudioMixin(StubSourceMixin):
         self.sound_receive = False
         self.sound_send = False
         self.sound_fade_timer = None
+        self.sound_av_sync_timer = None
         self.new_stream_timers = {}
+        self.sound_actions = {
+            action : getattr(self, name) for action, name in get_sound_control_methods(type(self)).items()
+            }
 
     def cleanup(self):
         log("%s.cleanup()", self)
@@ -66,10 +131,9 @@ class AudioMixin(StubSourceMixin):
 
 
     def stop_new_stream_notifications(self):
-        timers = self.new_stream_timers.copy()
+        timers = self.new_stream_timers
         self.new_stream_timers = {}
         for proc, timer in timers.items():
-            timer = self.new_stream_timers.pop(proc, None)
             if timer:
                 self.source_remove(timer)
             self.stop_new_stream_notification(proc)
@@ -122,18 +186,16 @@ class AudioMixin(StubSourceMixin):
             "send"              : self.supports_speaker and len(self.speaker_codecs)>0,
             "receive"           : self.supports_microphone and len(self.microphone_codecs)>0,
             })
-        caps = flatten_dict({"sound" : sound_props})
+        caps = flatten_dict(sound_props, prefix="sound")
         caps["audio"] = sound_props
         return caps
 
 
     def audio_loop_check(self, mode="speaker") -> bool:
         log("audio_loop_check(%s)", mode)
-        from xpra.sound.gstreamer_util import ALLOW_SOUND_LOOP, loop_warning_messages
         if ALLOW_SOUND_LOOP:
             return True
-        machine_id = get_machine_id()
-        uuid = get_user_uuid()
+        machine_id, uuid = get_local_ids()
         #these attributes belong in a different mixin,
         #so we can't assume that they exist:
         client_machine_id = getattr(self, "machine_id", None)
@@ -148,8 +210,9 @@ class AudioMixin(StubSourceMixin):
                 #different user, assume different pulseaudio server
                 return True
         #check pulseaudio id if we have it
-        pulseaudio_id = self.sound_properties.get("pulseaudio", {}).get("id")
-        pulseaudio_cookie_hash = self.sound_properties.get("pulseaudio", {}).get("cookie-hash")
+        pulseaudio = self.sound_properties.get("pulseaudio") or {}
+        pulseaudio_id = pulseaudio.get("id")
+        pulseaudio_cookie_hash = pulseaudio.get("cookie-hash")
         log("audio_loop_check(%s) pulseaudio id=%s, client pulseaudio id=%s",
                  mode, pulseaudio_id, self.pulseaudio_id)
         log("audio_loop_check(%s) pulseaudio cookie hash=%s, client pulseaudio cookie hash=%s",
@@ -216,6 +279,8 @@ class AudioMixin(StubSourceMixin):
             if not ss:
                 return None
             ss.sequence = self.sound_source_sequence
+            ss.default_latency = get_default_latency(ss.codec)
+            self.sound_source_buffers = 0
             ss.connect("new-buffer", new_buffer or self.new_sound_buffer)
             ss.connect("new-stream", new_stream or self.new_stream)
             ss.connect("info", self.sound_source_info)
@@ -251,6 +316,7 @@ class AudioMixin(StubSourceMixin):
         log("stop_sending_sound() sound_source=%s", ss)
         if ss:
             self.sound_source = None
+            self.cancel_sound_av_sync_timer()
             self.send_eos(ss.codec, ss.sequence)
             self.sound_source_sequence += 1
             ss.cleanup()
@@ -269,30 +335,7 @@ class AudioMixin(StubSourceMixin):
     def new_stream(self, sound_source, codec):
         if NEW_STREAM_SOUND:
             try:
-                from xpra.platform.paths import get_resources_dir
-                sample = os.path.join(get_resources_dir(), "bell.wav")
-                log("new_stream(%s, %s) sample=%s, exists=%s", sound_source, codec, sample, os.path.exists(sample))
-                if os.path.exists(sample):
-                    if POSIX:
-                        sink = "alsasink"
-                    else:
-                        sink = "autoaudiosink"
-                    cmd = [
-                        "gst-launch-1.0", "-q",
-                        "filesrc", "location=%s" % sample,
-                        "!", "decodebin",
-                        "!", "audioconvert",
-                        "!", sink]
-                    import subprocess
-                    proc = subprocess.Popen(cmd)
-                    log("Popen(%s)=%s", cmd, proc)
-                    from xpra.child_reaper import getChildReaper
-                    getChildReaper().add_process(proc, "new-stream-sound", cmd, ignore=True, forget=True)
-                    def stop_new_stream_notification():
-                        if self.new_stream_timers.pop(proc, None):
-                            self.stop_new_stream_notification(proc)
-                    timer = self.timeout_add(NEW_STREAM_SOUND_STOP*1000, stop_new_stream_notification)
-                    self.new_stream_timers[proc] = timer
+                self.play_new_stream_sound()
             except Exception as e:
                 log("new_stream(%s, %s) error playing new stream sound", sound_source, codec, exc_info=True)
                 log.error("Error playing new-stream bell sound:")
@@ -303,6 +346,7 @@ class AudioMixin(StubSourceMixin):
             return
         codec = codec or sound_source.codec
         sound_source.codec = codec
+        sound_source.default_latency = get_default_latency(codec)
         #tell the client this is the start:
         self.send("sound-data", codec, "",
                   {
@@ -313,8 +357,50 @@ class AudioMixin(StubSourceMixin):
         self.call_update_av_sync_delay()
         #run it again after 10 seconds,
         #by that point the source info will actually be populated:
-        from gi.repository import GLib
-        GLib.timeout_add(10*1000, self.call_update_av_sync_delay)
+        def delayed_av_sync_update():
+            self.sound_av_sync_timer = None
+            if self.sound_source==sound_source:
+                self.call_update_av_sync_delay()
+            return False
+        self.cancel_sound_av_sync_timer()
+        self.sound_av_sync_timer = self.timeout_add(10*1000, delayed_av_sync_update)
+
+    def cancel_sound_av_sync_timer(self):
+        sat = self.sound_av_sync_timer
+        if sat:
+            self.sound_av_sync_timer = None
+            self.source_remove(sat)
+
+    def play_new_stream_sound(self):
+        #don't fork another player whilst the previous one is still playing:
+        for proc in self.new_stream_timers:
+            if proc.poll() is None:
+                log("play_new_stream_sound() %s is still playing", proc)
+                return
+        sample = get_bell_sample()
+        log("play_new_stream_sound() sample=%s", sample)
+        if not sample:
+            return
+        if POSIX:
+            sink = "alsasink"
+        else:
+            sink = "autoaudiosink"
+        cmd = [
+            "gst-launch-1.0", "-q",
+            "filesrc", "location=%s" % sample,
+            "!", "decodebin",
+            "!", "audioconvert",
+            "!", sink]
+        import subprocess
+        proc = subprocess.Popen(cmd)
+        log("Popen(%s)=%s", cmd, proc)
+        from xpra.child_reaper import getChildReaper
+        getChildReaper().add_process(proc, "new-stream-sound", cmd, ignore=True, forget=True)
+        def stop_new_stream_notification():
+            if self.new_stream_timers.pop(proc, None):
+                self.stop_new_stream_notification(proc)
+        timer = self.timeout_add(NEW_STREAM_SOUND_STOP*1000, stop_new_stream_notification)
+        self.new_stream_timers[proc] = timer
 
     def call_update_av_sync_delay(self):
         #loose coupling with avsync mixin:
@@ -325,8 +411,9 @@ class AudioMixin(StubSourceMixin):
 
 
     def new_sound_buffer(self, sound_source, data, metadata, packet_metadata=None):
-        log("new_sound_buffer(%s, %s, %s, %s) info=%s",
-                 sound_source, len(data or []), metadata, [len(x) for x in packet_metadata], sound_source.info)
+        if log.is_debug_enabled():
+            log("new_sound_buffer(%s, %s, %s, %s) info=%s",
+                sound_source, len(data or ()), metadata, [len(x) for x in (packet_metadata or ())], sound_source.info)
         if self.sound_source!=sound_source or self.is_closed():
             log("sound buffer dropped: from old source or closed")
             return
@@ -334,26 +421,29 @@ class AudioMixin(StubSourceMixin):
             log("sound buffer dropped: old sequence number: %s (current is %s)",
                 sound_source.sequence, self.sound_source_sequence)
             return
-        if packet_metadata:
-            #the packet metadata is compressed already:
-            packet_metadata = Compressed("packet metadata", packet_metadata, can_inline=True)
         #don't drop the first 10 buffers
-        can_drop_packet = (sound_source.info or {}).get("buffer_count", 0)>10
-        self.send_sound_data(sound_source, data, metadata, packet_metadata, can_drop_packet)
+        #(counted here, the "buffer_count" from the sound source info is only updated periodically)
+        self.sound_source_buffers += 1
+        self.send_sound_data(sound_source, data, metadata, packet_metadata, self.sound_source_buffers>10)
 
     def send_sound_data(self, sound_source, data, metadata, packet_metadata=None, can_drop_packet=False):
-        packet_data = [sound_source.codec, Compressed(sound_source.codec, data), metadata, packet_metadata or ()]
+        codec = sound_source.codec
         sequence = sound_source.sequence
         if sequence>=0:
             metadata["sequence"] = sequence
-        fail_cb = None
-        if can_drop_packet:
-            def sound_data_fail_cb():
-                #ideally we would tell gstreamer to send an audio "key frame"
-                #or synchronization point to ensure the stream recovers
-                log("a sound data buffer was not received and will not be resent")
-            fail_cb = sound_data_fail_cb
-        self.send("sound-data", *packet_data, synchronous=False, fail_cb=fail_cb, will_have_more=True)
+        if packet_metadata:
+            #the packet metadata is compressed already:
+            packet_metadata = Compressed("packet metadata", packet_metadata, can_inline=True)
+        else:
+            packet_metadata = ()
+        fail_cb = self.sound_data_fail_cb if can_drop_packet else None
+        self.send("sound-data", codec, Compressed(codec, data), metadata, packet_metadata,
+                  synchronous=False, fail_cb=fail_cb, will_have_more=True)
+
+    def sound_data_fail_cb(self):
+        #ideally we would tell gstreamer to send an audio "key frame"
+        #or synchronization point to ensure the stream recovers
+        log("a sound data buffer was not received and will not be resent")
 
     def stop_receiving_sound(self):
         ss = self.sound_sink
@@ -368,7 +458,7 @@ class AudioMixin(StubSourceMixin):
     def sound_control(self, action, *args):
         action = bytestostr(action)
         log("sound_control(%s, %s)", action, args)
-        method = getattr(self, "sound_control_%s" % (action.replace("-", "_")), None)
+        method = self.sound_actions.get(action)
         if method is None:
             msg = "unknown sound action: %s" % action
             log.error(msg)
@@ -393,23 +483,7 @@ class AudioMixin(StubSourceMixin):
 
     def sound_control_fadein(self, codec="", delay_str=""):
         self.do_sound_control_start(0.0, codec)
-        delay = 1000
-        if delay_str:
-            delay = max(1, min(10*1000, int(delay_str)))
-        step = 1.0/(delay/100.0)
-        log("sound_control fadein delay=%s, step=%1.f", delay, step)
-        def fadein():
-            ss = self.sound_source
-            if not ss:
-                return False
-            volume = ss.get_volume()
-            log("fadein() volume=%.1f", volume)
-            if volume<1.0:
-                volume = min(1.0, volume+step)
-                ss.set_volume(volume)
-            return volume<1.0
-        self.cancel_sound_fade_timer()
-        self.sound_fade_timer = self.timeout_add(100, fadein)
+        self.start_sound_fade(0.0, 1.0, delay_str)
 
     def sound_control_start(self, codec=""):
         self.do_sound_control_start(1.0, codec)
@@ -426,29 +500,41 @@ class AudioMixin(StubSourceMixin):
 
     def sound_control_fadeout(self, delay_str=""):
         assert self.sound_source, "no active audio capture"
+        self.start_sound_fade(1.0, 0.0, delay_str, self.stop_sending_sound)
+
+    def sound_control_new_sequence(self, seq_str):
+        self.sound_source_sequence = int(seq_str)
+        return "new sequence is %s" % self.sound_source_sequence
+
+
+    def start_sound_fade(self, start, end, delay_str="", end_cb=None):
         delay = 1000
         if delay_str:
             delay = max(1, min(10*1000, int(delay_str)))
-        step = 1.0/(delay/100.0)
-        log("sound_control fadeout delay=%s, step=%1.f", delay, step)
-        def fadeout():
+        #one volume step every 100ms:
+        steps = max(1, round(delay/100))
+        log("start_sound_fade%s steps=%i", (start, end, delay), steps)
+        #the volume is calculated from the step count rather than read back from the sound source,
+        #(the value from the sound subprocess is only updated with its "info" signal)
+        step = 0
+        def fade():
+            nonlocal step
             ss = self.sound_source
             if not ss:
+                self.sound_fade_timer = None
                 return False
-            volume = ss.get_volume()
-            log("fadeout() volume=%.1f", volume)
-            if volume>0:
-                ss.set_volume(max(0, volume-step))
+            step += 1
+            volume = start + (end-start)*step/steps
+            log("fade() volume=%.1f", volume)
+            ss.set_volume(volume)
+            if step<steps:
                 return True
-            self.stop_sending_sound()
+            self.sound_fade_timer = None
+            if end_cb:
+                end_cb()
             return False
         self.cancel_sound_fade_timer()
-        self.sound_fade_timer = self.timeout_add(100, fadeout)
-
-    def sound_control_new_sequence(self, seq_str):
-        self.sound_source_sequence = int(seq_str)
-        return "new sequence is %s" % self.sound_source_sequence
-
+        self.sound_fade_timer = self.timeout_add(100, fade)
 
     def cancel_sound_fade_timer(self):
         sft = self.sound_fade_timer
@@ -457,8 +543,9 @@ class AudioMixin(StubSourceMixin):
             self.source_remove(sft)
 
     def sound_data(self, codec, data, metadata, packet_metadata=()):
-        log("sound_data(%s, %s, %s, %s) sound sink=%s",
-            codec, len(data or []), metadata, packet_metadata, self.sound_sink)
+        if log.is_debug_enabled():
+            log("sound_data(%s, %s, %s, %s) sound sink=%s",
+                codec, len(data or ()), metadata, packet_metadata, self.sound_sink)
         if self.is_closed():
             return
         if self.sound_sink is not None and codec!=self.sound_sink.codec:
@@ -472,13 +559,6 @@ class AudioMixin(StubSourceMixin):
         if not self.sound_sink:
             if not self.audio_loop_check("microphone"):
                 #make a fake object so we don't fire the audio loop check warning repeatedly
-                class FakeSink:
-                    def __init__(self, codec):
-                        self.codec = codec
-                    def add_data(self, *args):
-                        log("FakeSink.add_data%s ignored", args)
-                    def cleanup(self, *args):
-                        log("FakeSink.cleanup%s ignored", args)
                 self.sound_sink = FakeSink(codec)
                 return
             try:
@@ -508,16 +588,16 @@ class AudioMixin(StubSourceMixin):
         if ss:
             info = typedict(ss.info or {})
             try:
-                qdict = info.dictget("queue")
-                if qdict:
-                    q = typedict(qdict).intget("cur", 0)
-                    log("server side queue level: %s", q)
+                if log.is_debug_enabled():
+                    qdict = info.dictget("queue")
+                    if qdict:
+                        q = typedict(qdict).intget("cur", 0)
+                        log("server side queue level: %s", q)
                 #get the latency from the source info, if it has it:
                 encoder_latency = info.intget("latency", -1)
                 if encoder_latency<0:
                     #fallback to hard-coded values:
-                    from xpra.sound.gstreamer_util import ENCODER_LATENCY, RECORD_PIPELINE_LATENCY
-                    encoder_latency = RECORD_PIPELINE_LATENCY + ENCODER_LATENCY.get(ss.codec, 0)
+                    encoder_latency = ss.default_latency
                     cinfo = "%s " % ss.codec
                 #processing overhead
                 encoder_latency += 100
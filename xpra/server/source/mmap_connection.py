@@ -4,9 +4,18 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
+import os
 from random import randint
 
 from xpra.util import typedict
+from xpra.os_util import get_int_uuid, WIN32
+from xpra.simple_stats import std_unit
+from xpra.net.mmap_pipe import (
+    init_server_mmap,
+    read_mmap_token,
+    write_mmap_token,
+    DEFAULT_TOKEN_BYTES,
+    )
 from xpra.server.source.stub_source_mixin import StubSourceMixin
 
 from xpra.log import Logger
@@ -52,18 +61,14 @@ class MMAP_Connection(StubSourceMixin):
 
 
     def parse_client_caps(self, c : typedict):
-        import os
-        from xpra.os_util import WIN32
         self.mmap_client_namespace = c.boolget("mmap.namespace", False)
-        sep = "." if self.mmap_client_namespace else "_"
-        def mmapattr(k):
-            return "mmap%s%s" % (sep, k)
-        mmap_filename = c.strget(mmapattr("file"))
+        prefix = "mmap." if self.mmap_client_namespace else "mmap_"
+        mmap_filename = c.strget(prefix+"file")
         if not mmap_filename:
             return
-        mmap_size = c.intget(mmapattr("size"), 0)
+        mmap_size = c.intget(prefix+"size", 0)
         log("client supplied mmap_file=%s", mmap_filename)
-        mmap_token = c.intget(mmapattr("token"))
+        mmap_token = c.intget(prefix+"token")
         log("mmap supported=%s, token=%s", self.supports_mmap, mmap_token)
         if self.mmap_filename:
             if os.path.isdir(self.mmap_filename):
@@ -80,18 +85,12 @@ class MMAP_Connection(StubSourceMixin):
         elif not os.path.exists(mmap_filename):
             log("mmap_file '%s' cannot be found!", mmap_filename)
         else:
-            from xpra.net.mmap_pipe import (
-                init_server_mmap,
-                read_mmap_token,
-                write_mmap_token,
-                DEFAULT_TOKEN_BYTES,
-                )
             self.mmap, self.mmap_size = init_server_mmap(mmap_filename, mmap_size)
             log("found client mmap area: %s, %i bytes - min mmap size=%i in '%s'",
                 self.mmap, self.mmap_size, self.min_mmap_size, mmap_filename)
             if self.mmap_size>0:
-                index = c.intget(mmapattr("token_index"), 0)
-                count = c.intget(mmapattr("token_bytes"), DEFAULT_TOKEN_BYTES)
+                index = c.intget(prefix+"token_index", 0)
+                count = c.intget(prefix+"token_bytes", DEFAULT_TOKEN_BYTES)
                 v = read_mmap_token(self.mmap, index, count)
                 log("mmap_token=%#x, verification=%#x", mmap_token, v)
                 if v!=mmap_token:
@@ -108,7 +107,6 @@ class MMAP_Connection(StubSourceMixin):
                     self.mmap = None
                     self.mmap_size = 0
                 else:
-                    from xpra.os_util import get_int_uuid
                     self.mmap_client_token = get_int_uuid()
                     self.mmap_client_token_bytes = DEFAULT_TOKEN_BYTES
                     self.mmap_client_token_index = randint(0, self.mmap_size-self.mmap_client_token_bytes)
@@ -117,18 +115,15 @@ class MMAP_Connection(StubSourceMixin):
                                      self.mmap_client_token_index,
                                      self.mmap_client_token_bytes)
         if self.mmap_size>0:
-            from xpra.simple_stats import std_unit
             log.info(" mmap is enabled using %sB area in %s", std_unit(self.mmap_size, unit=1024), mmap_filename)
 
     def get_caps(self) -> dict:
         caps = {"mmap_enabled" : self.mmap_size>0}
         if self.mmap_client_token:
-            sep = "." if self.mmap_client_namespace else "_"
-            def mmapattr(name, value):
-                caps["mmap%s%s" % (sep, name)] = value
-            mmapattr("token",       self.mmap_client_token)
-            mmapattr("token_index", self.mmap_client_token_index)
-            mmapattr("token_bytes", self.mmap_client_token_bytes)
+            prefix = "mmap." if self.mmap_client_namespace else "mmap_"
+            caps[prefix+"token"] = self.mmap_client_token
+            caps[prefix+"token_index"] = self.mmap_client_token_index
+            caps[prefix+"token_bytes"] = self.mmap_client_token_bytes
         return caps
 
     def get_info(self) -> dict:
@@ -26,21 +26,21 @@ MAX_VREFRESH = envint("XPRA_MAX_VREFRESH", 250)
 log = Logger("damage")
 
 def ival(key, default, minv=0, maxv=None) -> int:
+    v = os.environ.get("XPRA_BATCH_%s" % key)
+    if v is None:
+        return default
     try:
-        v = os.environ.get("XPRA_BATCH_%s" % key)
-        if v is None:
-            return default
         iv = int(v)
-        if minv is not None and iv<minv:
-            log.warn("value for %s is too small: %s (minimum is %s)", key, iv, minv)
-            return minv
-        if maxv is not None and iv>maxv:
-            log.warn("value for %s is too high: %s (maximum is %s)", key, iv, maxv)
-            return maxv
-        return iv
-    except Exception as e:
+    except ValueError as e:
         log.warn("failed to parse value '%s' for %s: %s", v, key, e)
         return default
+    if minv is not None and iv<minv:
+        log.warn("value for %s is too small: %s (minimum is %s)", key, iv, minv)
+        return minv
+    if maxv is not None and iv>maxv:
+        log.warn("value for %s is too high: %s (maximum is %s)", key, iv, maxv)
+        return maxv
+    return iv
 
 
 ALWAYS = ival("ALWAYS", 0, 0, 1)==1
@@ -110,14 +110,14 @@ class DamageBatchConfig:
         if self.locked:
             info["delay"] = self.delay
         else:
-            ld = tuple(x[1] for x in tuple(self.last_delays))
+            ld = [x[1] for x in tuple(self.last_delays)]
             if ld:
                 ls = get_list_stats(ld)
                 ldv = self.last_delay
                 if ldv:
                     ls["last"] = ldv[1]  #pylint: disable=unsubscriptable-object
                 info["delay"] = ls
-            lad = tuple(x[1] for x in tuple(self.last_actual_delays))
+            lad = [x[1] for x in tuple(self.last_actual_delays)]
             if lad:
                 ls = get_list_stats(lad, show_percentile=(9,))
                 ladv = self.last_actual_delay
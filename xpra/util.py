@@ -761,9 +761,9 @@ def notypedict(d):
             d[k] = notypedict(v)
     return dict(d)
 
-def flatten_dict(info, sep="."):
+def flatten_dict(info, sep=".", prefix=None):
     to = {}
-    _flatten_dict(to, sep, None, info)
+    _flatten_dict(to, sep, prefix, info)
     return to
 
 def _flatten_dict(to, sep, path, d):
@@ -80,19 +80,12 @@ def save_fakeXinerama_config(supported=True, source="", ss=()):
         return delfile("cannot save fake xinerama settings: no monitors!")
     if len(monitors)>=10:
         return delfile("cannot save fake xinerama settings: too many monitors! (%s)" % len(monitors))
-    #generate the file data:
-    data = ["# file generated by xpra %s for display %s" % (XPRA_VERSION, os.environ.get("DISPLAY")),
-            "# %s monitors:" % len(monitors),
-            "%s" % len(monitors)]
     #the new config (numeric values only)
     config = [len(monitors)]
-    for i, m in enumerate(monitors):
+    for m in monitors:
         if len(m)<7:
             return delfile("cannot save fake xinerama settings: incomplete monitor data for monitor: %s" % (m, ))
-        plug_name, x, y, width, height, wmm, hmm = m[:7]
-        data.append("# %s (%smm x %smm)" % (prettify_plug_name(plug_name, "monitor %s" % i), wmm, hmm))
-        data.append("%s %s %s %s" % (x, y, width, height))
-        config.append((x, y, width, height))
+        config.append(tuple(m[1:5]))
     if current_xinerama_config==config:
         #we assume that no other process is going to overwrite the deprecated .fakexinerama
         log("fake xinerama config unchanged")
@@ -101,11 +94,19 @@ def save_fakeXinerama_config(supported=True, source="", ss=()):
     log(" old=%s", current_xinerama_config)
     log(" new=%s", config)
     current_xinerama_config = config
+    #generate the file data:
+    data = ["# file generated by xpra %s for display %s" % (XPRA_VERSION, os.environ.get("DISPLAY")),
+            "# %s monitors:" % len(monitors),
+            "%s" % len(monitors)]
+    for i, m in enumerate(monitors):
+        plug_name, x, y, width, height, wmm, hmm = m[:7]
+        data.append("# %s (%smm x %smm)" % (prettify_plug_name(plug_name, "monitor %s" % i), wmm, hmm))
+        data.append("%s %s %s %s" % (x, y, width, height))
     data.append("")
-    contents = "\n".join(data)
+    contents = "\n".join(data).encode("utf8")
     for filename in fakeXinerama_config_files:
         try:
-            with open(filename, "w", encoding="utf8") as f:
+            with open(filename, "wb") as f:
                 f.write(contents)
         except Exception as e:
             log("writing to '%s'", filename, exc_info=True)